@@ -0,0 +1,287 @@
+"""Local stand-ins for the upstream services used by the benchmark suite
+
+- FakeZeppServer: huami auth/login endpoints plus a band_data.json emulator
+- FakeChatServer: OpenAI-compatible chat completion endpoint with latency
+- SmtpSink: minimal SMTP server that accepts and discards messages
+"""
+import base64
+import json
+import random
+import socketserver
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def _user_id_for(username):
+    """Derive a stable numeric user id from a username"""
+    return str(1000000000 + zlib.crc32(username.encode("utf-8")) % 900000000)
+
+
+def build_summary(user_id, date_str):
+    """Build a realistic decoded day summary for a user and date"""
+    rng = random.Random(f"{user_id}:{date_str}")
+    day_start = int(datetime.strptime(date_str, "%Y-%m-%d").timestamp())
+
+    stages = []
+    minute = rng.randint(300, 480)
+    total_steps = total_dis = total_cal = 0
+    run_dist = run_cal = run_count = walk_minutes = 0
+    while minute < 1380 and len(stages) < 40:
+        duration = rng.randint(3, 40)
+        mode = rng.choice([1, 1, 1, 3, 3, 4, 5])
+        steps = duration * rng.randint(60, 170) if mode != 5 else 0
+        dis = int(steps * rng.uniform(0.6, 0.9)) if mode != 5 else duration * 250
+        cal = int(dis * rng.uniform(0.03, 0.06))
+        stages.append({
+            "start": minute,
+            "stop": minute + duration,
+            "mode": mode,
+            "dis": dis,
+            "cal": cal,
+            "step": steps
+        })
+        total_steps += steps
+        total_dis += dis
+        total_cal += cal
+        if mode == 4:
+            run_count += 1
+            run_dist += dis
+            run_cal += cal
+        else:
+            walk_minutes += duration
+        minute += duration + rng.randint(1, 120)
+
+    deep = rng.randint(40, 140)
+    light = rng.randint(200, 360)
+    sleep_start = day_start - rng.randint(60, 180) * 60
+    return {
+        "v": 6,
+        "slp": {
+            "st": sleep_start,
+            "ed": sleep_start + (deep + light) * 60,
+            "dp": deep,
+            "lt": light,
+            "wk": rng.randint(0, 4),
+            "usrSt": -1440,
+            "usrEd": -1440,
+            "wc": rng.randint(0, 30),
+            "is": 0,
+            "lb": rng.randint(50, 95),
+            "to": 480,
+            "dt": 0,
+            "rhr": rng.randint(52, 72),
+            "ss": rng.randint(50, 95)
+        },
+        "stp": {
+            "ttl": total_steps,
+            "dis": total_dis,
+            "cal": total_cal,
+            "wk": walk_minutes,
+            "rn": run_count,
+            "runDist": run_dist,
+            "runCal": run_cal,
+            "stage": stages
+        },
+        "goal": 8000,
+        "tz": "28800",
+        "byteLength": 3,
+        "sync": day_start + 86000
+    }
+
+
+def build_band_data(user_id, from_date, to_date):
+    """Build a band_data.json payload covering [from_date, to_date]"""
+    start = datetime.strptime(from_date, "%Y-%m-%d")
+    end = datetime.strptime(to_date, "%Y-%m-%d")
+    items = []
+    day = start
+    while day <= end:
+        date_str = day.strftime("%Y-%m-%d")
+        summary = json.dumps(build_summary(user_id, date_str), separators=(",", ":"))
+        items.append({
+            "uid": user_id,
+            "data_type": 0,
+            "date_time": date_str,
+            "source": 0,
+            "summary": base64.b64encode(summary.encode("utf-8")).decode("ascii"),
+            "uuid": "",
+            "device_id": "DA932FFFFE8816E7"
+        })
+        day += timedelta(days=1)
+    return {"code": 1, "message": "success", "data": items}
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, avoid delayed-ACK stalls
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _ZeppHandler(_QuietHandler):
+    def do_POST(self):
+        path = urlparse(self.path).path
+        form = parse_qs(self._read_body().decode("utf-8"))
+
+        if path.startswith("/registrations/") and path.endswith("/tokens"):
+            username = path.split("/")[2]
+            code = base64.urlsafe_b64encode(username.encode("utf-8")).decode("ascii")
+            self.send_response(303)
+            self.send_header(
+                "Location",
+                f"https://s3-us-west-2.amazonaws.com/hm-registration/successsignin.html?access={code}&country_code=CN"
+            )
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif path == "/v2/client/login":
+            code = form.get("code", [""])[0]
+            username = base64.urlsafe_b64decode(code.encode("ascii")).decode("utf-8")
+            user_id = _user_id_for(username)
+            self._send_json({
+                "result": "ok",
+                "token_info": {
+                    "user_id": user_id,
+                    "login_token": f"login-{user_id}",
+                    "app_token": f"app-{user_id}"
+                }
+            })
+        else:
+            self._send_json({"message": "not found"}, status=404)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/v1/data/band_data.json":
+            self._send_json({"message": "not found"}, status=404)
+            return
+        params = parse_qs(url.query)
+        self._send_json(build_band_data(
+            params["userid"][0],
+            params["from_date"][0],
+            params["to_date"][0]
+        ))
+
+
+class _ChatHandler(_QuietHandler):
+    def do_POST(self):
+        self._read_body()
+        time.sleep(self.server.latency)
+        advice = {
+            "notifications": [
+                {"time": "07:30", "message": "Take a 30 minute brisk walk"},
+                {"time": "12:15", "message": "Stand up and move for 5 minutes"},
+                {"time": "21:30", "message": "Prepare for bed to reach 7 hours of sleep"}
+            ],
+            "daily_summary": "Activity was close to the step goal, deep sleep ratio is adequate.",
+            "improvement_suggestions": ["Spread activity across the day", "Keep a regular bedtime"],
+            "achievements": ["Resting heart rate stayed in a healthy range"]
+        }
+        self._send_json({
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "bench-model",
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": json.dumps(advice, ensure_ascii=False)}
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        })
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode("ascii"))
+
+    def handle(self):
+        self._reply("220 localhost SMTP sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip().upper()
+            if command.startswith("EHLO"):
+                self.wfile.write(b"250-localhost\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+            elif command.startswith("HELO"):
+                self._reply("250 localhost")
+            elif command.startswith("AUTH"):
+                self._reply("235 Authentication successful")
+            elif command.startswith("DATA"):
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                with self.server.lock:
+                    self.server.message_count += 1
+                self._reply("250 OK")
+            elif command.startswith("QUIT"):
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("250 OK")
+
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _BackgroundServer:
+    """Run a socket server on a random local port in a daemon thread"""
+    def __init__(self, server):
+        self.server = server
+        self.host, self.port = server.server_address[:2]
+        self._thread = threading.Thread(target=server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+
+class FakeZeppServer(_BackgroundServer):
+    def __init__(self):
+        super().__init__(ThreadingHTTPServer(("127.0.0.1", 0), _ZeppHandler))
+
+
+class FakeChatServer(_BackgroundServer):
+    def __init__(self, latency=0.0):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _ChatHandler)
+        server.latency = latency
+        super().__init__(server)
+
+
+class SmtpSink(_BackgroundServer):
+    def __init__(self):
+        server = _ThreadingTCPServer(("127.0.0.1", 0), _SmtpHandler)
+        server.lock = threading.Lock()
+        server.message_count = 0
+        super().__init__(server)
+
+    @property
+    def message_count(self):
+        return self.server.message_count
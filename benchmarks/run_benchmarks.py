@@ -0,0 +1,230 @@
+"""Offline benchmark suite
+
+Spins up local stand-ins for Zepp, DeepSeek and SMTP, then drives the
+services, the Flask routes and health_monitor_task end to end. Each scenario
+runs in its own process so peak RSS is reported per scenario.
+
+Usage:
+    python benchmarks/run_benchmarks.py --users 5 --days 30 --iterations 20
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+SRC_DIR = ROOT_DIR / "src"
+
+SCENARIOS = ["mifit_fetch", "advisor", "email", "web_routes", "monitor_task"]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of values"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    """Peak resident set size of the current process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes on Linux
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def write_config(work_dir, zepp_url, chat_url, smtp_port):
+    """Write a config.json that points every upstream at the local fakes"""
+    config = {
+        "username": "bench_user_0",
+        "password": "bench_password",
+        "zepp": {
+            "auth_url": zepp_url,
+            "account_url": zepp_url,
+            "api_url": zepp_url
+        },
+        "deepseek": {
+            "api_key": "bench-key",
+            "base_url": f"{chat_url}/v1",
+            "model": "bench-model"
+        },
+        "smtp": {
+            "server": "127.0.0.1",
+            "port": smtp_port,
+            "sender_email": "bench@example.com",
+            "sender_password": "bench",
+            "use_tls": False
+        },
+        "receiver_email": "target@example.com",
+        # The fakes share one host, measure processing rather than the rate budget
+        "rate_limits": {"default": {"rate": 0}},
+        # Every request must do the full work rather than hit the response cache or a 429
+        "admission": {"enabled": False},
+        "health": {
+            "step_goal": 8000,
+            "sleep_hours": {"min": 7, "max": 8},
+            "deep_sleep_ratio": 0.2
+        }
+    }
+    config_path = Path(work_dir) / "data" / "config.json"
+    config_path.parent.mkdir(parents=True, exist_ok=True)
+    config_path.write_text(json.dumps(config, indent=2))
+    return config_path
+
+
+def build_scenario(name, args):
+    """Return a callable that executes one iteration of the scenario"""
+    sys.path.insert(0, str(SRC_DIR))
+
+    if name == "mifit_fetch":
+        from services.mi_fit_service import MiFitService
+        counter = {"i": 0}
+
+        def run():
+            username = f"bench_user_{counter['i'] % args.users}"
+            counter["i"] += 1
+            MiFitService(username=username).get_health_data(days=args.days)
+        return run
+
+    if name == "advisor":
+        from services.mi_fit_service import MiFitService
+        from services.health_advisor_service import HealthAdvisorService
+        health_data = MiFitService().get_health_data(days=args.days)
+        advisor = HealthAdvisorService()
+        return lambda: advisor.get_health_advice(health_data)
+
+    if name == "email":
+        from services.email_service import EmailService
+        service = EmailService()
+        return lambda: service.send_notification("08:00", "Benchmark notification")
+
+    if name == "web_routes":
+        from web_app import create_app
+        client = create_app().test_client()
+        routes = ["/", "/get_health_data", "/download_report", "/get_health_advice"]
+
+        def run():
+            for route in routes:
+                response = client.get(route)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{route} returned {response.status_code}")
+        return run
+
+    if name == "monitor_task":
+        import main
+        from apscheduler.schedulers.background import BackgroundScheduler
+        main.scheduler = BackgroundScheduler()
+        return main.health_monitor_task
+
+    raise ValueError(f"Unknown scenario: {name}")
+
+
+def run_worker(args):
+    """Run a single scenario in this process and print its result as JSON"""
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+    run = build_scenario(args.worker, args)
+
+    # Warm up imports, connections and caches
+    run()
+
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(args.iterations):
+        t0 = time.perf_counter()
+        try:
+            run()
+        except Exception as e:
+            errors += 1
+            logging.error(f"Iteration failed: {str(e)}")
+        latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - started
+
+    print(json.dumps({
+        "scenario": args.worker,
+        "iterations": args.iterations,
+        "errors": errors,
+        "throughput": args.iterations / elapsed if elapsed else 0.0,
+        "mean_ms": statistics.mean(latencies) if latencies else 0.0,
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+        "peak_rss_mb": peak_rss_mb()
+    }))
+
+
+def run_suite(args):
+    """Start the fake upstreams and run every selected scenario in a child process"""
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from fake_servers import FakeChatServer, FakeZeppServer, SmtpSink
+
+    zepp = FakeZeppServer().start()
+    chat = FakeChatServer(latency=args.llm_latency).start()
+    smtp = SmtpSink().start()
+    results = []
+
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            config_path = write_config(work_dir, zepp.url, chat.url, smtp.port)
+            env = dict(os.environ, HEALTH_MONITOR_CONFIG=str(config_path))
+
+            for scenario in args.scenario or SCENARIOS:
+                command = [
+                    sys.executable, str(Path(__file__).resolve()),
+                    "--worker", scenario,
+                    "--users", str(args.users),
+                    "--days", str(args.days),
+                    "--iterations", str(args.iterations)
+                ]
+                proc = subprocess.run(command, cwd=work_dir, env=env, capture_output=True, text=True)
+                if proc.returncode != 0:
+                    print(f"{scenario}: failed\n{proc.stderr}", file=sys.stderr)
+                    continue
+                results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    finally:
+        zepp.stop()
+        chat.stop()
+        smtp.stop()
+
+    print(f"{'scenario':<14} {'ops/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'rss MB':>8} {'errors':>7}")
+    for result in results:
+        print(
+            f"{result['scenario']:<14} {result['throughput']:>9.2f} {result['p50_ms']:>9.2f} "
+            f"{result['p99_ms']:>9.2f} {result['peak_rss_mb']:>8.1f} {result['errors']:>7}"
+        )
+    print(f"SMTP sink received {smtp.message_count} messages")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+    if len(results) != len(args.scenario or SCENARIOS) or any(r["errors"] for r in results):
+        sys.exit(1)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Health monitor offline benchmark suite")
+    parser.add_argument("--users", type=int, default=5, help="Number of emulated Zepp users")
+    parser.add_argument("--days", type=int, default=30, help="Days of history fetched per request")
+    parser.add_argument("--iterations", type=int, default=20, help="Measured iterations per scenario")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Chat endpoint latency in seconds")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="Scenario to run (repeatable)")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    parser.add_argument("--worker", choices=SCENARIOS, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    if arguments.worker:
+        run_worker(arguments)
+    else:
+        run_suite(arguments)
@@ -1,6 +1,5 @@
 import threading
 from web_app import create_app
-from main import run_monitor
 import logging
 from pathlib import Path
 import signal
@@ -29,6 +28,8 @@ def signal_handler(signum, frame):
 def start_monitor():
     """Start background monitoring service"""
     try:
+        # Imported in the monitor thread, keeps scheduler and API clients off the startup path
+        from main import run_monitor
         run_monitor(daemon=True)
     except Exception as e:
         logging.error(f"Monitor service error: {str(e)}")
@@ -0,0 +1,29 @@
+import argparse
+import logging
+from services.mi_fit_service import MiFitService
+from services.decode_service import DecodeService
+
+def setup_logging():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+def main():
+    """Fetch and store a long range of health history"""
+    parser = argparse.ArgumentParser(description="Backfill health history into the local store")
+    parser.add_argument("--start", required=True, help="First date to fetch (YYYY-MM-DD)")
+    parser.add_argument("--end", help="Last date to fetch (YYYY-MM-DD, default: today)")
+    parser.add_argument("--username", help="Zepp account (default: configured account)")
+    parser.add_argument("--password", help="Zepp password (default: configured password)")
+    parser.add_argument("--window-days", type=int, default=90, help="Days fetched per request")
+    parser.add_argument("--workers", type=int, help="Decode worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    setup_logging()
+    service = MiFitService(username=args.username, password=args.password)
+    changed = service.backfill(args.start, args.end, args.window_days, DecodeService(workers=args.workers))
+    print(f"Stored {changed} changed days")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import argparse
+import logging
+from services.export_service import ExportService, FORMATS
+
+def setup_logging():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+def main():
+    """Export stored health history to a columnar format"""
+    parser = argparse.ArgumentParser(description="Bulk export of stored health history")
+    parser.add_argument("output", help="Output directory (npy, parquet) or file (npz)")
+    parser.add_argument("--format", choices=FORMATS, default="npy", help="Export format")
+    parser.add_argument("--user", action="append", dest="users", help="User id to export (repeatable)")
+    parser.add_argument("--start", help="First date to export (YYYY-MM-DD)")
+    parser.add_argument("--end", help="Last date to export (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    setup_logging()
+    path = ExportService().export(args.output, args.format, args.users, args.start, args.end)
+    print(f"Export written to: {path}")
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,33 @@
 import logging
 from services.mi_fit_service import MiFitService
 from services.health_advisor_service import HealthAdvisorService
-from services.scheduler_service import SchedulerService
 from pathlib import Path
 import json
+import hashlib
 from datetime import datetime
 import signal
 import sys
-from apscheduler.schedulers.background import BackgroundScheduler
+import threading
 from services.email_service import EmailService
+from services.config import get_config_path
+from services.report_service import ReportService
+from services.job_service import get_job_service
+from services.advice_archive import get_advice_archive
+from services.health_store import get_health_store
+from services.sync_scheduler import SyncScheduler
+from services.profiling_service import get_profiler
 
 logger = logging.getLogger(__name__)
 
+# Set by run_monitor, None when tasks run outside the monitor (e.g. benchmarks)
+scheduler = None
+coordinator = None
+notification_plan = None
+
+# (day, claim, email) of notifications whose send failed, retried on the next run
+failed_notifications = []
+failed_notifications_lock = threading.Lock()
+
 def setup_logging():
     logging.basicConfig(
         level=logging.DEBUG,
@@ -22,48 +38,128 @@ def setup_logging():
         ]
     )
 
-def get_latest_health_data():
-    """Get the latest health data file content"""
+def get_latest_health_data(username=None):
+    """Get the latest detailed health report, rendered on demand"""
     try:
-        data_dir = Path("data_export")
-        if not data_dir.exists():
-            return None
-            
-        files = list(data_dir.glob("api_response_*.txt"))
-        if not files:
+        reports = ReportService()
+        user_id = reports.resolve_user(username)
+        if not user_id:
             return None
             
-        latest_file = max(files, key=lambda x: x.stat().st_mtime)
-        with open(latest_file, 'r', encoding='utf-8') as f:
-            return f.read()
+        text, _ = reports.get_report(user_id)
+        return text
     except Exception as e:
         logging.error(f"Failed to read health data: {str(e)}")
         return None
 
-def send_notification(time, message):
-    """Send notification email"""
+def load_config():
+    """Load the config file, empty if unavailable"""
     try:
-        email_service = EmailService()
-        email_service.send_notification(time, message)
-        logger.info(f"Sent notification for {time}: {message}")
+        with open(get_config_path(), 'r') as f:
+            return json.load(f)
     except Exception as e:
-        logger.error(f"Failed to send notification: {str(e)}")
+        logger.error(f"Failed to load configuration: {str(e)}")
+        return {}
+
+def load_accounts():
+    """Accounts to monitor: the "accounts" list, or the top-level account"""
+    config = load_config()
+    return config.get("accounts") or [{"username": config.get("username"), "password": config.get("password")}]
+
+def owns(username):
+    """Whether this process runs scheduled work for an account"""
+    return coordinator is None or coordinator.owns(username)
 
-def health_monitor_task():
+def send_due_notifications(time=None):
+    """Email the reminders due this minute, batched over one SMTP connection
+
+    Each reminder is claimed before sending so only one process sends it.
+    Reminders that were not delivered have their claims given back and
+    are retried on the next run, so an SMTP outage does not lose the
+    day's reminders and delivered ones are never sent twice.
+    """
+    global failed_notifications
+    try:
+        time = time or datetime.now().strftime("%H:%M")
+        today = datetime.now().strftime("%Y-%m-%d")
+        with failed_notifications_lock:
+            pending = [n for n in failed_notifications if n[0] == today]
+            failed_notifications = []
+        for delivery in notification_plan.due(time):
+            if not owns(delivery.username):
+                continue
+            digest = hashlib.sha1(delivery.key.encode("utf-8")).hexdigest()
+            subject, content = delivery.render()
+            pending.append((today, f"notification:{digest}", (subject, content, delivery.receiver_email)))
+            
+        claimed = []
+        for day, claim, email in pending:
+            if coordinator and not coordinator.claim(claim, day):
+                logger.debug(f"Notification {email[0]} was already sent")
+                continue
+            claimed.append((day, claim, email))
+            
+        if not claimed:
+            return
+        delivered = set(EmailService().send_batch([email for _, _, email in claimed]))
+        undelivered = [n for i, n in enumerate(claimed) if i not in delivered]
+        if undelivered:
+            for day, claim, _ in undelivered:
+                if coordinator:
+                    coordinator.unclaim(claim, day)
+            with failed_notifications_lock:
+                failed_notifications.extend(undelivered)
+            logger.warning(f"Will retry {len(undelivered)} notifications on the next run")
+        logger.info(f"Sent {len(delivered)} of {len(claimed)} notifications due at {time}")
+    except Exception as e:
+        logger.error(f"Failed to send notifications: {str(e)}")
+
+def schedule_notifications(notifications, username=None):
+    """Plan daily notification emails, replacing the account's earlier reminders"""
+    if notification_plan is None:
+        return
+    notification_plan.set_notifications(username, notifications)
+
+def restore_notifications():
+    """Schedule notifications of the latest archived advice for the accounts this process owns
+
+    Runs after taking over from another process, whose scheduled
+    notifications were lost with it.
+    """
+    archive = get_advice_archive()
+    store = get_health_store()
+    for account in load_accounts():
+        username = account.get("username")
+        user_id = store.user_for_account(username)
+        if not user_id or not owns(username):
+            continue
+        advice = archive.latest(user_id)
+        if advice:
+            schedule_notifications(advice.get("notifications", []), username)
+
+def health_monitor_task(account=None):
     """Health monitoring task"""
+    with get_profiler().profile("task:health_monitor"):
+        _run_health_monitor(account or {})
+
+def _run_health_monitor(account):
     logger = logging.getLogger(__name__)
     
     try:
         logger.info("Starting health monitoring process")
         
         # 1. Get health data
-        service = MiFitService()
+        service = MiFitService(username=account.get("username"), password=account.get("password"))
         health_data = service.get_health_data()
         logger.info("Successfully retrieved health data")
         
+        if not service.changed_days and advice_is_current(service.username):
+            logger.info("No new data since the last advice, skipping advice")
+            return
+        
         # 2. Get health advice
         advisor = HealthAdvisorService()
-        detailed_data = get_latest_health_data()
+        detailed_data = get_latest_health_data(service.username)
         if detailed_data:
             combined_data = {
                 "summary": health_data,
@@ -76,31 +172,86 @@ def health_monitor_task():
         logger.info("Successfully generated health advice")
         
         # Schedule notification emails
-        for notification in advice.get("notifications", []):
-            scheduler.add_job(
-                send_notification,
-                'cron',
-                hour=notification['time'].split(':')[0],
-                minute=notification['time'].split(':')[1],
-                args=[notification['time'], notification['message']],
-                id=f'notification_{notification["time"].replace(":", "_")}',
-                replace_existing=True
-            )
+        schedule_notifications(advice.get("notifications", []), account.get("username"))
         
-        # 3. Save advice using advisor service
-        advisor._save_advice(json.dumps(advice, ensure_ascii=False, indent=2))
+        # 3. Advice was archived by the advisor service
         logger.info("Health advice saved")
         
     except Exception as e:
         logger.error(f"Task execution failed: {str(e)}")
+        # Let the sync scheduler count and retry the failure
+        raise
+
+def advice_is_current(username):
+    """Whether the latest advice is newer than the last change to the account's data"""
+    store = get_health_store()
+    user_id = store.user_for_account(username)
+    state = store.sync_state(username)
+    if not user_id or not state or not state["last_change"]:
+        return False
+    record = get_advice_archive().latest_record(user_id)
+    last_change = datetime.fromtimestamp(state["last_change"]).isoformat(timespec="seconds")
+    return record is not None and record["created_at"] >= last_change
+
+def run_due_tasks(startup=False):
+    """Sync owned accounts whose current slot is unclaimed, in priority order
+
+    Called when the nightly sync window opens and after leadership or
+    membership changes, so a process taking over runs work a failed
+    process missed. On startup owned accounts are synced even when the
+    slot was claimed or they were fetched recently.
+    """
+    sync = SyncScheduler()
+    slot = sync.current_slot()
+    if coordinator:
+        coordinator.prune_claims()
+    accounts = [account for account in load_accounts() if owns(account.get("username"))]
+    if not accounts:
+        return
+
+    def claim(account):
+        claimed = coordinator is None or coordinator.claim(f"health_monitor:{account.get('username')}", slot)
+        return claimed or startup
+
+    get_job_service().submit(
+        "sync",
+        lambda job: sync.run(accounts, health_monitor_task, claim, force=startup, job=job),
+        key="sync"
+    )
+
+def compact_advice_archive():
+    """Apply advice retention to every user, once a day across all processes"""
+    try:
+        today = datetime.now().strftime("%Y-%m-%d")
+        if coordinator and not coordinator.claim("advice_archive:compact", today):
+            return
+        get_advice_archive().compact()
+        logger.info("Compacted advice archive")
+    except Exception as e:
+        logger.error(f"Failed to compact advice archive: {str(e)}")
+
+def coordination_heartbeat():
+    """Renew the lease and pick up work after leadership or membership changes"""
+    try:
+        if coordinator.heartbeat():
+            run_due_tasks()
+            restore_notifications()
+    except Exception as e:
+        logger.error(f"Coordination heartbeat failed: {str(e)}")
 
 def signal_handler(signum, frame):
     """Handle exit signals"""
     logger = logging.getLogger(__name__)
     logger.info("Received exit signal, stopping services...")
-    scheduler.stop()
+    scheduler.shutdown(wait=False)
+    if coordinator:
+        coordinator.release()
     sys.exit(0)
 
+def load_scheduler_config():
+    """Load the "scheduler" config section"""
+    return load_config().get("scheduler", {})
+
 def run_monitor(daemon=False):
     """Run monitoring service"""
     logger = logging.getLogger(__name__)
@@ -111,19 +262,57 @@ def run_monitor(daemon=False):
             signal.signal(signal.SIGINT, signal_handler)
             signal.signal(signal.SIGTERM, signal_handler)
         
-        # Create and start scheduler
-        global scheduler
+        # Imported here so web startup does not pay for it
+        from apscheduler.schedulers.background import BackgroundScheduler
+        from services.lease_service import LeaseService
+        from services.notification_service import NotificationService
+        scheduler_config = load_scheduler_config()
+        
+        # Join the other monitor processes before deciding what this one owns
+        global scheduler, coordinator, notification_plan
+        coordinator = LeaseService()
+        coordinator.heartbeat()
+        notification_plan = NotificationService()
+        
+        # Create and start scheduler, syncing when the nightly window opens
+        hour, minute = SyncScheduler().start_time
         scheduler = BackgroundScheduler()
         scheduler.add_job(
-            health_monitor_task,
+            run_due_tasks,
             'cron',
-            hour=3,
+            hour=hour,
+            minute=minute,
             kwargs={}  # 明确指定不传入额外参数
         )
+        # Users who stopped getting advice are only aged out by this daily pass
+        scheduler.add_job(
+            compact_advice_archive,
+            'cron',
+            hour=hour,
+            minute=minute,
+            id='advice_archive_compaction'
+        )
+        scheduler.add_job(
+            coordination_heartbeat,
+            'interval',
+            seconds=coordinator.heartbeat_interval,
+            id='coordination_heartbeat'
+        )
+        # One delivery run per minute sends every reminder due in it
+        scheduler.add_job(
+            send_due_notifications,
+            'cron',
+            minute='*',
+            id='notifications',
+            misfire_grace_time=30,
+            coalesce=True
+        )
         scheduler.start()
+        restore_notifications()
         
-        # Execute task immediately
-        health_monitor_task()
+        # Initial sync runs in the background so startup never waits on upstream calls
+        if scheduler_config.get("sync_on_startup", True):
+            run_due_tasks(startup=True)
         
         # Keep program running if not daemon
         if not daemon:
@@ -0,0 +1,211 @@
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from .report_service import get_mode_description
+
+MINUTES_PER_DAY = 1440
+
+# Time-of-day bounds for late night and early morning activity
+LATE_MINUTE = 23 * 60
+EARLY_MINUTE = 6 * 60
+
+def _ordinal(date):
+    return datetime.strptime(date, "%Y-%m-%d").toordinal()
+
+class ActivityIndex:
+    """Interval index over one user's activity stages
+
+    Stages are kept in parallel arrays sorted by absolute start minute
+    (day ordinal * 1440 + minute of day). A running maximum of stop minutes
+    makes "stages overlapping [a, b)" two binary searches, so time-of-day
+    queries over months of history only touch the matching stages.
+    """
+    def __init__(self, stages):
+        # stages: iterable of (date, start, stop, mode, distance, calories, steps)
+        rows = sorted(
+            (_ordinal(date) * MINUTES_PER_DAY + start, _ordinal(date) * MINUTES_PER_DAY + stop,
+             mode, distance, calories, steps)
+            for date, start, stop, mode, distance, calories, steps in stages
+        )
+        self.starts = array('q', (r[0] for r in rows))
+        self.stops = array('q', (r[1] for r in rows))
+        self.modes = array('i', (r[2] for r in rows))
+        self.distances = array('q', (r[3] for r in rows))
+        self.calories = array('q', (r[4] for r in rows))
+        self.steps = array('q', (r[5] for r in rows))
+
+        self.max_stops = array('q')
+        running = -1
+        for stop in self.stops:
+            running = max(running, stop)
+            self.max_stops.append(running)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _overlapping(self, lo, hi):
+        """Indexes of stages overlapping the absolute minute range [lo, hi)"""
+        first = bisect_right(self.max_stops, lo)
+        last = bisect_left(self.starts, hi)
+        return [i for i in range(first, last) if self.stops[i] > lo]
+
+    def _day_range(self, start_date, end_date):
+        lo = _ordinal(start_date) * MINUTES_PER_DAY if start_date else -1
+        hi = (_ordinal(end_date) + 1) * MINUTES_PER_DAY if end_date else (1 << 62)
+        return lo, hi
+
+    def minutes_in_window(self, start_date, end_date, from_minute, to_minute, modes=None):
+        """Activity minutes inside a daily time-of-day window, e.g. 23:00-24:00
+
+        A window with from_minute > to_minute wraps past midnight.
+        """
+        if from_minute > to_minute:
+            return (self.minutes_in_window(start_date, end_date, from_minute, MINUTES_PER_DAY, modes)
+                    + self.minutes_in_window(start_date, end_date, 0, to_minute, modes))
+
+        if not self.starts:
+            return 0
+        first_day = _ordinal(start_date) if start_date else self.starts[0] // MINUTES_PER_DAY
+        last_day = _ordinal(end_date) if end_date else self.max_stops[-1] // MINUTES_PER_DAY
+
+        total = 0
+        for day in range(first_day, last_day + 1):
+            lo = day * MINUTES_PER_DAY + from_minute
+            hi = day * MINUTES_PER_DAY + to_minute
+            for i in self._overlapping(lo, hi):
+                if modes and self.modes[i] not in modes:
+                    continue
+                total += max(0, min(self.stops[i], hi) - max(self.starts[i], lo))
+        return total
+
+    def hourly_histogram(self, start_date=None, end_date=None, modes=None):
+        """Activity minutes and steps per hour of day
+
+        Steps of a stage spanning several hours are split in proportion to
+        the minutes spent in each hour.
+        """
+        minutes = [0] * 24
+        steps = [0.0] * 24
+        lo, hi = self._day_range(start_date, end_date)
+        for i in self._overlapping(lo, hi):
+            if modes and self.modes[i] not in modes:
+                continue
+            start, stop = max(self.starts[i], lo), min(self.stops[i], hi)
+            duration = self.stops[i] - self.starts[i]
+            minute = start
+            while minute < stop:
+                hour_end = min(stop, (minute // 60 + 1) * 60)
+                hour = (minute % MINUTES_PER_DAY) // 60
+                minutes[hour] += hour_end - minute
+                if duration:
+                    steps[hour] += self.steps[i] * (hour_end - minute) / duration
+                minute = hour_end
+        return {"minutes": minutes, "steps": [round(s) for s in steps]}
+
+    def longest_continuous(self, modes, start_date=None, end_date=None, max_gap=1):
+        """Longest run of back-to-back stages in `modes`
+
+        Stages separated by at most `max_gap` minutes count as continuous.
+        Returns {"date", "start", "stop", "minutes"} or None.
+        """
+        lo, hi = self._day_range(start_date, end_date)
+        best = None
+        run_start = run_stop = None
+        for i in self._overlapping(lo, hi):
+            if self.modes[i] not in modes:
+                if run_start is not None:
+                    best = self._longer(best, run_start, run_stop)
+                run_start = None
+                continue
+            if run_start is not None and self.starts[i] - run_stop <= max_gap:
+                run_stop = max(run_stop, self.stops[i])
+            else:
+                if run_start is not None:
+                    best = self._longer(best, run_start, run_stop)
+                run_start, run_stop = self.starts[i], self.stops[i]
+        if run_start is not None:
+            best = self._longer(best, run_start, run_stop)
+        return best
+
+    def _longer(self, best, start, stop):
+        if best is not None and best["minutes"] >= stop - start:
+            return best
+        day = start // MINUTES_PER_DAY
+        return {
+            "date": datetime.fromordinal(day).strftime("%Y-%m-%d"),
+            "start": start - day * MINUTES_PER_DAY,
+            "stop": stop - day * MINUTES_PER_DAY,
+            "minutes": stop - start
+        }
+
+    def totals_by_mode(self, start_date=None, end_date=None):
+        """Minutes, steps, distance and calories per activity mode"""
+        totals = {}
+        lo, hi = self._day_range(start_date, end_date)
+        for i in self._overlapping(lo, hi):
+            entry = totals.setdefault(self.modes[i], {"minutes": 0, "steps": 0, "distance": 0, "calories": 0})
+            entry["minutes"] += self.stops[i] - self.starts[i]
+            entry["steps"] += self.steps[i]
+            entry["distance"] += self.distances[i]
+            entry["calories"] += self.calories[i]
+        return totals
+
+def activity_summary(index, start_date=None, end_date=None):
+    """Exercise time distribution for a date range, keyed by readable mode names"""
+    modes = index.totals_by_mode(start_date, end_date)
+    return {
+        "hourly": index.hourly_histogram(start_date, end_date),
+        "late_minutes": index.minutes_in_window(start_date, end_date, LATE_MINUTE, MINUTES_PER_DAY),
+        "early_minutes": index.minutes_in_window(start_date, end_date, 0, EARLY_MINUTE),
+        "by_mode": {get_mode_description(mode): totals for mode, totals in sorted(modes.items())},
+        "longest": {
+            get_mode_description(mode): index.longest_continuous([mode], start_date, end_date)
+            for mode in sorted(modes)
+        }
+    }
+
+def format_activity_summary(summary):
+    """Describe an activity summary as text for prompts"""
+    hours = [
+        f"{hour:02d}:00 {minutes} min"
+        for hour, minutes in enumerate(summary["hourly"]["minutes"]) if minutes
+    ]
+    lines = [
+        "Active minutes by hour of day: " + (", ".join(hours) or "none"),
+        f"Minutes of activity after 23:00: {summary['late_minutes']}",
+        f"Minutes of activity before 06:00: {summary['early_minutes']}"
+    ]
+    for mode, totals in summary["by_mode"].items():
+        line = f"{mode}: {totals['minutes']} min, {totals['steps']:,} steps, {totals['distance']:,} m"
+        longest = summary["longest"].get(mode)
+        if longest:
+            line += (f", longest continuous {longest['minutes']} min on {longest['date']} "
+                     f"from {longest['start'] // 60:02d}:{longest['start'] % 60:02d}")
+        lines.append(line)
+    return "\n".join(lines)
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_activity_index(store, user_id):
+    """Get a user's ActivityIndex, rebuilt only when the stored data changed"""
+    version = store.data_version(user_id)
+    with _indexes_lock:
+        cached = _indexes.get((id(store), user_id))
+        if cached and cached[0] == version:
+            return cached[1]
+
+    stages = (
+        (date, start, stop, mode, distance, calories, steps)
+        for _, date, _, start, stop, mode, distance, calories, steps in store.iter_stages([user_id])
+    )
+    index = ActivityIndex(stages)
+    with _indexes_lock:
+        _indexes[(id(store), user_id)] = (version, index)
+    return index
+
+def recent_range(days):
+    """(start, end) dates of the trailing `days` days, ending today"""
+    end = datetime.now()
+    return (end - timedelta(days=days - 1)).strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
@@ -0,0 +1,169 @@
+import json
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from .config import get_config_path
+from .rate_limit import TokenBucket
+
+# Clients whose token buckets are kept, the least recently seen are dropped first
+MAX_CLIENTS = 4096
+
+# Responses kept for cache hits and for degraded service under load
+RESPONSE_CACHE_SIZE = 64
+
+class Rejected(Exception):
+    """A request was not admitted, retry after `retry_after` seconds"""
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+class AdmissionController:
+    """Admission control for requests that trigger upstream work
+
+    Each client has its own token bucket, and a global bucket plus a
+    concurrency limit protect the upstream quotas shared by everyone.
+    Requests over the global limits wait in a bounded queue for at most
+    `max_wait_seconds`. When the queue is full, or a client is over its
+    budget, the request is rejected with a retry delay instead of blocking
+    a server thread. Recent responses are cached, so repeated requests are
+    answered without upstream work and rejected ones can still be served a
+    stale copy.
+    """
+    def __init__(self):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.config_path = get_config_path()
+        self._load_config()
+        self._lock = threading.Lock()
+        self._turn = threading.Condition(self._lock)
+        self._running = 0
+        self._waiting = 0
+        self._clients = OrderedDict()
+        self._responses = OrderedDict()
+        self.global_bucket = TokenBucket(self.global_rate, self.global_burst)
+
+    def _load_config(self):
+        """Load admission configuration"""
+        try:
+            with open(self.config_path, 'r') as f:
+                config = json.load(f)
+        except Exception:
+            config = {}
+
+        admission_config = config.get("admission", {})
+        self.enabled = admission_config.get("enabled", True)
+        # Upstream-triggering requests per second and burst, per client and in total, 0 is unlimited
+        self.client_rate = admission_config.get("client_rate", 0.2)
+        self.client_burst = admission_config.get("client_burst", 3)
+        self.global_rate = admission_config.get("global_rate", 1.0)
+        self.global_burst = admission_config.get("global_burst", 5)
+        self.max_concurrent = admission_config.get("max_concurrent", 4)
+        self.max_queue = admission_config.get("max_queue", 8)
+        self.max_wait_seconds = admission_config.get("max_wait_seconds", 10)
+        # Responses younger than cache_seconds skip admission, ones younger
+        # than stale_seconds are served when a request is rejected
+        self.cache_seconds = admission_config.get("cache_seconds", 60)
+        self.stale_seconds = admission_config.get("stale_seconds", 86400)
+        # Header holding the client address behind a reverse proxy, e.g. "X-Forwarded-For"
+        self.client_header = admission_config.get("client_header")
+
+    def _client_bucket(self, client):
+        with self._lock:
+            bucket = self._clients.get(client)
+            if bucket is None:
+                bucket = TokenBucket(self.client_rate, self.client_burst)
+                self._clients[client] = bucket
+                while len(self._clients) > MAX_CLIENTS:
+                    self._clients.popitem(last=False)
+            else:
+                self._clients.move_to_end(client)
+            return bucket
+
+    def _try_start(self):
+        """Start a request if a slot and a global token are free, caller holds the lock
+
+        Returns 0 when started, the seconds until the next global token, or
+        None when every slot is busy.
+        """
+        if self._running >= self.max_concurrent:
+            return None
+        wait = self.global_bucket.try_acquire()
+        if not wait:
+            self._running += 1
+        return wait
+
+    @contextmanager
+    def admit(self, client):
+        """Hold a turn to run upstream work, raises Rejected when over the limits"""
+        if not self.enabled:
+            yield
+            return
+
+        wait = self._client_bucket(client).try_acquire()
+        if wait:
+            self.logger.info(f"Rejected request from {client}: over the client rate limit")
+            raise Rejected("Too many requests, please retry later", wait)
+
+        deadline = time.monotonic() + self.max_wait_seconds
+        with self._turn:
+            # Queued requests go first
+            wait = None if self._waiting else self._try_start()
+            if wait != 0:
+                if self._waiting >= self.max_queue:
+                    self.logger.info(f"Rejected request from {client}: {self._waiting} requests queued")
+                    raise Rejected("Server is busy, please retry later", self.max_wait_seconds)
+                self._waiting += 1
+                try:
+                    while wait != 0:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.logger.info(f"Rejected request from {client}: no turn within {self.max_wait_seconds}s")
+                            raise Rejected("Server is busy, please retry later", self.max_wait_seconds)
+                        # Woken by a finished request, or when the next global token is due
+                        self._turn.wait(min(remaining, wait) if wait else remaining)
+                        wait = self._try_start()
+                finally:
+                    self._waiting -= 1
+                    # Pass the turn on, the next waiter may start on a free slot or wait for its token
+                    if self._waiting and self._running < self.max_concurrent:
+                        self._turn.notify()
+        try:
+            yield
+        finally:
+            with self._turn:
+                self._running -= 1
+                self._turn.notify()
+
+    def cached(self, key, max_age):
+        """(payload, age in seconds) of a response younger than `max_age`, else None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._responses.get(key)
+        if entry is None:
+            return None
+        age = time.time() - entry[0]
+        return (entry[1], age) if age < max_age else None
+
+    def store(self, key, payload):
+        """Cache a successful response"""
+        if not self.enabled or not self.stale_seconds:
+            return
+        with self._lock:
+            self._responses[key] = (time.time(), payload)
+            self._responses.move_to_end(key)
+            while len(self._responses) > RESPONSE_CACHE_SIZE:
+                self._responses.popitem(last=False)
+
+_admission = None
+_admission_lock = threading.Lock()
+
+def get_admission_controller():
+    """Get the process-wide AdmissionController"""
+    global _admission
+    with _admission_lock:
+        if _admission is None:
+            _admission = AdmissionController()
+        return _admission
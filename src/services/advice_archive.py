@@ -0,0 +1,206 @@
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from .config import get_config_path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS advice (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    advice TEXT NOT NULL,
+    metrics TEXT,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_advice_user_date ON advice (user_id, date, id);
+CREATE TABLE IF NOT EXISTS latest_advice (
+    user_id TEXT PRIMARY KEY,
+    advice_id INTEGER NOT NULL
+);
+"""
+
+# Columns added after the first release, created on existing archives
+MIGRATIONS = {
+    "metrics": "ALTER TABLE advice ADD COLUMN metrics TEXT",
+    "source": "ALTER TABLE advice ADD COLUMN source TEXT"
+}
+
+class AdviceArchive:
+    """Append-only archive of generated health advice
+
+    Advice is indexed by (user, date) and a per-user pointer to the newest
+    entry makes "latest advice" a single primary key lookup. Retention and
+    per-day compaction are applied on append, and to every user by compact().
+    """
+    def __init__(self, path=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.config_path = get_config_path()
+        self._load_config()
+        if path:
+            self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """Add columns missing from archives created by older versions"""
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(advice)")}
+        with self._conn:
+            for column, statement in MIGRATIONS.items():
+                if column not in columns:
+                    self._conn.execute(statement)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_advice_user_source ON advice (user_id, source, id)"
+            )
+
+    def _load_config(self):
+        """Load archive configuration"""
+        try:
+            with open(self.config_path, 'r') as f:
+                config = json.load(f)
+        except Exception:
+            config = {}
+
+        archive_config = config.get("advice_archive", {})
+        self.path = Path(archive_config.get("path", "data_export/advice/advice_archive.db"))
+        # Days of advice history to keep, 0 keeps everything
+        self.retention_days = archive_config.get("retention_days", 365)
+        # Entries kept per user and day, older same-day entries are compacted away
+        self.keep_per_day = archive_config.get("keep_per_day", 1)
+
+    def append(self, user_id, advice, date=None, metrics=None, source=None):
+        """Archive an advice dict, returns the new entry id
+
+        `metrics` are the computed metrics the advice was based on and
+        `source` tells how it was generated ("llm" or "rules").
+        """
+        date = date or datetime.now().strftime("%Y-%m-%d")
+        user_id = str(user_id)
+
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO advice (user_id, date, created_at, advice, metrics, source) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, date, datetime.now().isoformat(timespec="seconds"),
+                 json.dumps(advice, ensure_ascii=False),
+                 json.dumps(metrics) if metrics is not None else None, source)
+            )
+            advice_id = cursor.lastrowid
+            self._conn.execute(
+                "INSERT OR REPLACE INTO latest_advice (user_id, advice_id) VALUES (?, ?)",
+                (user_id, advice_id)
+            )
+            self._compact_user(user_id, date, source)
+
+        self.logger.info(f"Archived advice {advice_id} for user {user_id} on {date}")
+        return advice_id
+
+    def _compact_user(self, user_id, date, source=None):
+        """Apply retention and same-day compaction for one user
+
+        Compaction is per source, so rule-based advice never removes the
+        LLM advice later advice is compared against.
+        """
+        if self.keep_per_day:
+            self._conn.execute(
+                "DELETE FROM advice WHERE user_id = ? AND date = ? AND source IS ? AND id NOT IN "
+                "(SELECT id FROM advice WHERE user_id = ? AND date = ? AND source IS ? "
+                "ORDER BY id DESC LIMIT ?)",
+                (user_id, date, source, user_id, date, source, self.keep_per_day)
+            )
+        if self.retention_days:
+            cutoff = (datetime.now() - timedelta(days=self.retention_days)).strftime("%Y-%m-%d")
+            self._conn.execute("DELETE FROM advice WHERE user_id = ? AND date < ?", (user_id, cutoff))
+
+    def compact(self):
+        """Apply retention and compaction to every user
+
+        append() only compacts the user it archives for, this also ages out
+        users who no longer get advice. Holds the lock throughout, so it
+        never interleaves with appends and lookups from other threads.
+        """
+        with self._lock:
+            with self._conn:
+                rows = self._conn.execute("SELECT DISTINCT user_id, date, source FROM advice").fetchall()
+                for row in rows:
+                    self._compact_user(row["user_id"], row["date"], row["source"])
+                # Drop pointers whose entry was removed by retention
+                self._conn.execute(
+                    "DELETE FROM latest_advice WHERE advice_id NOT IN (SELECT id FROM advice)"
+                )
+            self._conn.execute("VACUUM")
+
+    def latest_record(self, user_id=None):
+        """Get the newest archive entry for a user, or across all users"""
+        with self._lock:
+            if user_id is not None:
+                row = self._conn.execute(
+                    "SELECT a.* FROM latest_advice l JOIN advice a ON a.id = l.advice_id "
+                    "WHERE l.user_id = ?", (str(user_id),)
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    "SELECT a.* FROM latest_advice l JOIN advice a ON a.id = l.advice_id "
+                    "ORDER BY l.advice_id DESC LIMIT 1"
+                ).fetchone()
+        return self._to_record(row)
+
+    def latest_from(self, user_id, source):
+        """Get the newest archive entry for a user generated by `source`"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM advice WHERE user_id = ? AND source = ? ORDER BY id DESC LIMIT 1",
+                (str(user_id), source)
+            ).fetchone()
+        return self._to_record(row)
+
+    def latest(self, user_id=None):
+        """Get the newest advice dict, None if no advice was archived"""
+        record = self.latest_record(user_id)
+        return record["advice"] if record else None
+
+    def _to_record(self, row):
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "user_id": row["user_id"],
+            "date": row["date"],
+            "created_at": row["created_at"],
+            "advice": json.loads(row["advice"]),
+            "metrics": json.loads(row["metrics"]) if row["metrics"] else None,
+            "source": row["source"]
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_archives = {}
+_archives_lock = threading.Lock()
+
+def _configured_archive_path():
+    """Get the archive path from the "advice_archive" config section"""
+    try:
+        with open(get_config_path(), 'r') as f:
+            config = json.load(f)
+    except Exception:
+        config = {}
+    return Path(config.get("advice_archive", {}).get("path", "data_export/advice/advice_archive.db"))
+
+def get_advice_archive(path=None):
+    """Get the shared AdviceArchive instance for a database path"""
+    resolved = Path(path) if path else _configured_archive_path()
+    key = str(resolved.resolve())
+    with _archives_lock:
+        if key not in _archives:
+            _archives[key] = AdviceArchive(resolved)
+        return _archives[key]
@@ -0,0 +1,151 @@
+from datetime import datetime
+from .health_store import extract_day
+
+# Metrics compared against the previous LLM advice, with the change that counts as fully significant
+SIGNIFICANCE_SCALES = {
+    "avg_steps": 0.3,        # relative change
+    "sleep_hours": 0.15,     # relative change
+    "deep_ratio": 0.1,       # absolute change
+    "resting_hr": 0.1,       # relative change
+    "late_minutes": 60       # absolute change in minutes
+}
+
+# Goal flags that always make a change significant when they flip
+GOAL_FLAGS = ["step_goal_met", "sleep_in_range", "deep_ratio_met"]
+
+def compute_metrics(health_data, step_goal, sleep_hours, deep_sleep_ratio, late_minutes=0):
+    """Compute the metrics advice is based on from fetched band_data
+
+    Today's partial day is left out when earlier days are available.
+    Returns None when the data has no usable days.
+    """
+    if isinstance(health_data, dict) and "summary" in health_data:
+        health_data = health_data["summary"]
+    if not isinstance(health_data, dict):
+        return None
+
+    rows = [
+        extract_day(item, item.get("summary_decoded") or {})[0]
+        for item in health_data.get("data") or [] if "summary_decoded" in item
+    ]
+    today = datetime.now().strftime("%Y-%m-%d")
+    if len(rows) > 1:
+        rows = [row for row in rows if row["date"] != today] or rows
+    if not rows:
+        return None
+    rows.sort(key=lambda row: row["date"])
+
+    steps = [row["total_steps"] for row in rows]
+    slept = [row for row in rows if row["deep_sleep"] + row["light_sleep"]]
+    sleep_minutes = sum(row["deep_sleep"] + row["light_sleep"] for row in slept)
+    heart_rates = [row["resting_hr"] for row in rows if row["resting_hr"]]
+
+    avg_steps = round(sum(steps) / len(steps))
+    avg_sleep = round(sleep_minutes / len(slept) / 60, 2) if slept else 0
+    deep_ratio = round(sum(row["deep_sleep"] for row in slept) / sleep_minutes, 3) if sleep_minutes else 0
+
+    return {
+        "start_date": rows[0]["date"],
+        "end_date": rows[-1]["date"],
+        "days": len(rows),
+        "avg_steps": avg_steps,
+        "goal_days": sum(1 for s in steps if s >= step_goal),
+        "latest_steps": steps[-1],
+        "sleep_hours": avg_sleep,
+        "deep_ratio": deep_ratio,
+        "resting_hr": round(sum(heart_rates) / len(heart_rates)) if heart_rates else 0,
+        "late_minutes": late_minutes,
+        "step_goal_met": avg_steps >= step_goal,
+        "sleep_in_range": bool(slept) and sleep_hours["min"] <= avg_sleep <= sleep_hours["max"],
+        "deep_ratio_met": bool(slept) and deep_ratio >= deep_sleep_ratio
+    }
+
+def significance(current, previous):
+    """Score how much the metrics changed since previous advice, 1.0 or more is a large change"""
+    if not previous:
+        return float("inf")
+    if any(current.get(flag) != previous.get(flag) for flag in GOAL_FLAGS):
+        return float("inf")
+
+    score = 0.0
+    for name, scale in SIGNIFICANCE_SCALES.items():
+        now, before = current.get(name, 0), previous.get(name, 0)
+        if name in ("deep_ratio", "late_minutes"):
+            change = abs(now - before)
+        else:
+            change = abs(now - before) / max(abs(before), 1)
+        score = max(score, change / scale)
+    return score
+
+class AdviceRules:
+    """Deterministic advice from configured goals and computed metrics
+
+    Produces the same JSON fields as the LLM advice.
+    """
+    def __init__(self, step_goal, sleep_hours, deep_sleep_ratio):
+        self.step_goal = step_goal
+        self.sleep_hours = sleep_hours
+        self.deep_sleep_ratio = deep_sleep_ratio
+
+    def advise(self, metrics):
+        notifications = []
+        suggestions = []
+        achievements = []
+
+        deficit = self.step_goal - metrics["avg_steps"]
+        if deficit > 0:
+            suggestions.append(
+                f"You averaged {metrics['avg_steps']:,} steps, {deficit:,} below your goal of "
+                f"{self.step_goal:,}. Add a brisk walk of about {max(10, round(deficit / 100))} minutes."
+            )
+            notifications.append({"time": "12:30", "message": "Take a 15 minute walk after lunch to build up your steps."})
+            notifications.append({"time": "18:30", "message": f"Check your step count and close the gap to {self.step_goal:,} steps with an evening walk."})
+        else:
+            achievements.append(f"Step goal reached with an average of {metrics['avg_steps']:,} steps a day.")
+            notifications.append({"time": "18:30", "message": "Great activity level, keep up your usual walk today."})
+
+        if not metrics["sleep_hours"]:
+            suggestions.append("No sleep was recorded, wear your band at night to track sleep.")
+        elif metrics["sleep_hours"] < self.sleep_hours["min"]:
+            suggestions.append(
+                f"You slept {metrics['sleep_hours']:.1f} hours on average, aim for at least "
+                f"{self.sleep_hours['min']} hours by going to bed earlier."
+            )
+            notifications.append({"time": "22:00", "message": "Start winding down now and put away screens to get to bed on time."})
+        elif metrics["sleep_hours"] > self.sleep_hours["max"]:
+            suggestions.append(
+                f"You slept {metrics['sleep_hours']:.1f} hours on average, more than "
+                f"{self.sleep_hours['max']} hours. Keep a consistent wake-up time."
+            )
+        else:
+            achievements.append(f"Healthy sleep duration of {metrics['sleep_hours']:.1f} hours on average.")
+
+        if metrics["sleep_hours"]:
+            if metrics["deep_ratio"] < self.deep_sleep_ratio:
+                suggestions.append(
+                    f"Deep sleep was {metrics['deep_ratio']:.0%} of total sleep, below the recommended "
+                    f"{self.deep_sleep_ratio:.0%}. Avoid caffeine after noon and keep the bedroom dark and cool."
+                )
+            else:
+                achievements.append(f"Deep sleep made up {metrics['deep_ratio']:.0%} of your sleep.")
+
+        if metrics["late_minutes"]:
+            suggestions.append(
+                f"You were active for {metrics['late_minutes']} minutes after 23:00 in the last week, "
+                "move exercise earlier in the evening."
+            )
+
+        summary = (
+            f"From {metrics['start_date']} to {metrics['end_date']} you averaged {metrics['avg_steps']:,} steps "
+            f"({metrics['goal_days']} of {metrics['days']} days at goal)"
+        )
+        if metrics["sleep_hours"]:
+            summary += f" and {metrics['sleep_hours']:.1f} hours of sleep"
+        summary += "."
+
+        return {
+            "notifications": sorted(notifications, key=lambda n: n["time"]),
+            "daily_summary": summary,
+            "improvement_suggestions": suggestions,
+            "achievements": achievements
+        }
@@ -0,0 +1,168 @@
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import numpy as np
+from .health_store import get_health_store
+
+# Chart series: (stored columns summed into the value, scale, decimals, unit)
+SERIES = {
+    "steps": (("total_steps",), 1, 0, "steps"),
+    "sleep": (("deep_sleep", "light_sleep"), 1 / 60, 2, "hours"),
+    "deep_sleep": (("deep_sleep",), 1 / 60, 2, "hours"),
+    "resting_hr": (("resting_hr",), 1, 0, "bpm")
+}
+
+# Zero means "not recorded" for these series, so those days are left out
+SPARSE_SERIES = {"sleep", "deep_sleep", "resting_hr"}
+
+METHODS = ("lttb", "minmax")
+
+MIN_POINTS = 10
+MAX_POINTS = 2000
+
+# Downsampled charts kept in memory, keyed by (user_id, start, end, points, method, series)
+CACHE_SIZE = 64
+
+def _ordinal(date):
+    return datetime.strptime(date, "%Y-%m-%d").toordinal()
+
+def lttb(x, y, points):
+    """Indices of `points` samples picked by Largest-Triangle-Three-Buckets
+
+    The first and last samples are kept. Every bucket in between keeps the
+    sample forming the largest triangle with the previously kept sample and
+    the average of the next bucket, which preserves peaks and the visual
+    shape of the series.
+    """
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    kept = np.empty(points, dtype=np.int64)
+    kept[0] = 0
+    kept[-1] = n - 1
+    previous = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x = x[hi:edges[i + 2]].mean()
+            next_y = y[hi:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        ax, ay = x[previous], y[previous]
+        areas = np.abs((ax - next_x) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y - ay))
+        previous = lo + int(areas.argmax())
+        kept[i + 1] = previous
+    return kept
+
+def minmax(y, points):
+    """Indices of the minimum and maximum sample of `points // 2` equal buckets"""
+    n = len(y)
+    buckets = points // 2
+    if points >= n or buckets < 1:
+        return np.arange(n)
+
+    starts = np.linspace(0, n, buckets + 1).astype(np.int64)[:-1]
+    bucket = np.repeat(np.arange(buckets), np.diff(np.append(starts, n)))
+    kept = []
+    for extremes in (np.minimum.reduceat(y, starts), np.maximum.reduceat(y, starts)):
+        matches = np.flatnonzero(y == extremes[bucket])
+        # First matching sample of each bucket
+        _, first = np.unique(bucket[matches], return_index=True)
+        kept.append(matches[first])
+    return np.unique(np.concatenate(kept))
+
+class ChartService:
+    """Serve long-range chart series downsampled from the local store
+
+    Each series is loaded as one numpy array and reduced to the requested
+    number of points, either by LTTB or by keeping each bucket's min and
+    max. Results are cached by store data version, so repeated chart loads
+    of unchanged data are served from memory.
+    """
+    _cache = OrderedDict()
+    _cache_lock = threading.Lock()
+
+    def __init__(self, store=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.store = store or get_health_store()
+
+    def default_range(self, user_id, days=365):
+        """The `days` days ending at the user's latest stored date"""
+        end_date = self.store.latest_date(user_id)
+        if not end_date:
+            return None, None
+        start_date = (datetime.strptime(end_date, "%Y-%m-%d") - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        return start_date, end_date
+
+    def clamp_range(self, user_id, start_date, end_date):
+        """Narrow a range to the user's stored dates, so x offsets start at the first stored day"""
+        first_date = self.store.first_date(user_id)
+        latest_date = self.store.latest_date(user_id)
+        if first_date and start_date < first_date:
+            start_date = first_date
+        if latest_date and end_date > latest_date:
+            end_date = latest_date
+        return start_date, end_date
+
+    def get_chart(self, user_id, series, start_date, end_date, points=300, method="lttb"):
+        """Get downsampled series as {name: {unit, days, x, y}}
+
+        `x` holds day offsets from `start_date` and `y` the values, so a
+        multi-year chart is a few KB of JSON. Pass a range narrowed by
+        clamp_range(), or x will be offset by days with no data.
+        """
+        unknown = [name for name in series if name not in SERIES]
+        if unknown:
+            raise ValueError(f"Unknown series: {', '.join(unknown)}")
+        if method not in METHODS:
+            raise ValueError(f"Unknown downsampling method: {method}")
+        points = max(MIN_POINTS, min(MAX_POINTS, points))
+
+        key = (user_id, start_date, end_date, points, method, tuple(series))
+        version = self.store.data_version(user_id)
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached and cached[0] == version:
+                self._cache.move_to_end(key)
+                return cached[1]
+
+        chart = self._build(user_id, series, start_date, end_date, points, method)
+        with self._cache_lock:
+            self._cache[key] = (version, chart)
+            self._cache.move_to_end(key)
+            while len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return chart
+
+    def _build(self, user_id, series, start_date, end_date, points, method):
+        columns = sorted({column for name in series for column in SERIES[name][0]})
+        rows = list(self.store.iter_days(users=[user_id], start=start_date, end=end_date,
+                                         columns=["date"] + columns))
+        origin = _ordinal(start_date)
+        x = np.fromiter((_ordinal(row[0]) - origin for row in rows), dtype=np.float64, count=len(rows))
+        values = {
+            column: np.fromiter((row[i + 1] or 0 for row in rows), dtype=np.float64, count=len(rows))
+            for i, column in enumerate(columns)
+        }
+
+        chart = {}
+        for name in series:
+            summed, scale, decimals, unit = SERIES[name]
+            y = sum(values[column] for column in summed) * scale if rows else np.zeros(0)
+            days = x
+            if name in SPARSE_SERIES:
+                recorded = y > 0
+                days, y = x[recorded], y[recorded]
+            kept = lttb(days, y, points) if method == "lttb" else minmax(y, points)
+            chart[name] = {
+                "unit": unit,
+                "days": int(len(y)),
+                "x": days[kept].astype(np.int64).tolist(),
+                "y": np.round(y[kept], decimals).tolist() if decimals else y[kept].astype(np.int64).tolist()
+            }
+
+        self.logger.debug(f"Built {method} chart of {', '.join(series)} for {user_id} from {len(rows)} days")
+        return chart
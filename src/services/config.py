@@ -0,0 +1,15 @@
+import os
+from pathlib import Path
+
+# Environment variable that overrides the default config file location
+CONFIG_ENV_VAR = "HEALTH_MONITOR_CONFIG"
+
+DEFAULT_CONFIG_PATH = Path(__file__).parent.parent.parent / "data" / "config.json"
+
+
+def get_config_path():
+    """Get config file path, honoring the HEALTH_MONITOR_CONFIG override"""
+    override = os.environ.get(CONFIG_ENV_VAR)
+    if override:
+        return Path(override)
+    return DEFAULT_CONFIG_PATH
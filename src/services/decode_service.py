@@ -0,0 +1,145 @@
+import base64
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from .config import get_config_path
+from .health_store import extract_day, DAY_METRICS
+
+# Fields of each packed stage: seq, start, stop, mode, distance, calories, steps
+STAGE_WIDTH = 7
+
+def _decode_chunk(summaries):
+    """Decode base64 summaries into packed arrays
+
+    Runs in worker processes. Results are flat int64 arrays plus the decoded
+    JSON text, which pickle as a few contiguous buffers instead of one dict
+    tree per day.
+    """
+    metrics = array('q')
+    stages = array('q')
+    stage_counts = array('i')
+    texts = []
+    digests = []
+    errors = []
+
+    for i, summary in enumerate(summaries):
+        try:
+            text = base64.b64decode(summary).decode('utf-8')
+            row, day_stages = extract_day({}, json.loads(text))
+        except Exception as e:
+            errors.append((i, str(e)))
+            text, row, day_stages = None, {}, []
+
+        metrics.extend(row.get(name, 0) for name in DAY_METRICS)
+        stage_counts.append(len(day_stages))
+        for stage in day_stages:
+            stages.extend(stage)
+        texts.append(text)
+        digests.append(hashlib.sha1(summary.encode('utf-8')).hexdigest())
+
+    return metrics.tobytes(), stages.tobytes(), stage_counts.tobytes(), texts, digests, errors
+
+class DecodeService:
+    """Decode band_data items, sharding large batches across a process pool
+
+    The pool is started on the first parallel batch and kept until close(),
+    use the service as a context manager for multi-batch backfills.
+    """
+    def __init__(self, workers=None, chunk_size=None, min_parallel=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._pool = None
+        self._load_config()
+        if workers is not None:
+            self.workers = workers
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+        if min_parallel is not None:
+            self.min_parallel = min_parallel
+
+    def _load_config(self):
+        """Load decode configuration"""
+        try:
+            with open(get_config_path(), 'r') as f:
+                decode_config = json.load(f).get("decode", {})
+        except Exception:
+            decode_config = {}
+        self.workers = decode_config.get("workers") or os.cpu_count() or 1
+        self.chunk_size = decode_config.get("chunk_size", 256)
+        # Batches smaller than this are decoded in-process
+        self.min_parallel = decode_config.get("min_parallel", 1024)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    @property
+    def batch_size(self):
+        """Items needed to keep every worker busy with one chunk"""
+        return max(self.min_parallel, self.chunk_size * self.workers)
+
+    def _get_pool(self):
+        if self._pool is None:
+            # spawn avoids forking a process that has scheduler and web threads running
+            context = multiprocessing.get_context("spawn")
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        return self._pool
+
+    def decode(self, items):
+        """Decode items into (row, stages) pairs for HealthStore.upsert_days"""
+        items = [item for item in items if "summary" in item]
+        summaries = [item["summary"] for item in items]
+
+        if self.workers <= 1 or len(items) < self.min_parallel:
+            results = [_decode_chunk(summaries)]
+            offsets = [0]
+        else:
+            offsets = list(range(0, len(summaries), self.chunk_size))
+            chunks = [summaries[i:i + self.chunk_size] for i in offsets]
+            results = list(self._get_pool().map(_decode_chunk, chunks))
+            self.logger.info(f"Decoded {len(items)} items in {len(chunks)} chunks on {self.workers} workers")
+
+        days = []
+        for offset, result in zip(offsets, results):
+            days.extend(self._unpack(items, offset, result))
+        return days
+
+    def _unpack(self, items, offset, result):
+        """(row, stages) pairs of one decoded chunk, whose first item is items[offset]"""
+        metrics_bytes, stages_bytes, counts_bytes, texts, digests, errors = result
+        metrics, stages, counts = array('q'), array('q'), array('i')
+        metrics.frombytes(metrics_bytes)
+        stages.frombytes(stages_bytes)
+        counts.frombytes(counts_bytes)
+
+        failed = dict(errors)
+        width = len(DAY_METRICS)
+        stage_pos = 0
+        days = []
+        for i, count in enumerate(counts):
+            day_stages = [
+                tuple(stages[pos:pos + STAGE_WIDTH])
+                for pos in range(stage_pos, stage_pos + count * STAGE_WIDTH, STAGE_WIDTH)
+            ]
+            stage_pos += count * STAGE_WIDTH
+            if i in failed:
+                self.logger.error(f"Failed to decode {items[offset + i].get('date_time')}: {failed[i]}")
+                continue
+
+            item = items[offset + i]
+            row, _ = extract_day(item, {})
+            row.update(zip(DAY_METRICS, metrics[i * width:(i + 1) * width]))
+            row["summary"] = texts[i]
+            row["digest"] = digests[i]
+            days.append((row, day_stages))
+        return days
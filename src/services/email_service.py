@@ -5,11 +5,12 @@ import logging
 from pathlib import Path
 import json
 from datetime import datetime
+from .config import get_config_path
 
 class EmailService:
     def __init__(self):
         self.logger = logging.getLogger(self.__class__.__name__)
-        self.config_path = Path(__file__).parent.parent.parent / "data" / "config.json"
+        self.config_path = get_config_path()
         self._load_config()
         
     def _load_config(self):
@@ -22,6 +23,7 @@ class EmailService:
                 self.smtp_port = smtp_config.get("port", 587)
                 self.sender_email = smtp_config.get("sender_email")
                 self.sender_password = smtp_config.get("sender_password")
+                self.use_tls = smtp_config.get("use_tls", True)
                 self.receiver_email = config.get("receiver_email")
                 
                 if not all([self.smtp_server, self.sender_email, 
@@ -37,7 +39,7 @@ class EmailService:
         subject = f"Health Reminder: {time} Health Advice"
         self._send_email(subject, message)
         
-    def send_daily_summary(self, advice_data):
+    def send_daily_summary(self, advice_data, trends=None):
         """Send daily summary"""
         try:
             subject = f"Health Report: {datetime.now().strftime('%Y-%m-%d')} Health Data Summary"
@@ -62,26 +64,72 @@ class EmailService:
             for achievement in advice_data["achievements"]:
                 content += f"- {achievement}\n"
                 
+            if trends:
+                content += "\n"
+                content += "Weekly Trends (Last 90 Days)\n"
+                content += "----------------------------\n"
+                content += trends + "\n"
+                
             self._send_email(subject, content)
             
         except Exception as e:
             self.logger.error(f"Failed to send daily summary: {str(e)}")
             raise
             
-    def _send_email(self, subject, content):
-        """Send email"""
+    def send_batch(self, emails):
+        """Send (subject, content, receiver_email) emails over one SMTP connection
+
+        A receiver_email of None uses the configured recipient. Returns the
+        indices of the emails that were delivered. An email the server
+        refuses is logged and skipped. When the connection fails, the
+        emails not yet sent are left out of the result instead of raising,
+        so the caller can retry exactly those.
+        """
+        delivered = []
+        if not emails:
+            return delivered
         try:
-            msg = MIMEMultipart()
-            msg['From'] = self.sender_email
-            msg['To'] = self.receiver_email
-            msg['Subject'] = subject
+            with self._connect() as server:
+                for i, (subject, content, receiver_email) in enumerate(emails):
+                    try:
+                        server.send_message(self._build_message(subject, content, receiver_email))
+                        delivered.append(i)
+                    except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused,
+                            smtplib.SMTPDataError) as e:
+                        self.logger.error(f"Failed to send email {subject}: {str(e)}")
+                        
+        except Exception as e:
+            self.logger.error(f"Failed to send email batch: {str(e)}")
             
-            msg.attach(MIMEText(content, 'plain', 'utf-8'))
+        self.logger.info(f"Sent {len(delivered)} of {len(emails)} emails in one batch")
+        return delivered
             
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
+    def _connect(self):
+        """Open an authenticated SMTP connection"""
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port)
+        try:
+            if self.use_tls:
                 server.starttls()
-                server.login(self.sender_email, self.sender_password)
-                server.send_message(msg)
+            server.login(self.sender_email, self.sender_password)
+        except Exception:
+            server.close()
+            raise
+        return server
+        
+    def _build_message(self, subject, content, receiver_email=None):
+        msg = MIMEMultipart()
+        msg['From'] = self.sender_email
+        msg['To'] = receiver_email or self.receiver_email
+        msg['Subject'] = subject
+        
+        msg.attach(MIMEText(content, 'plain', 'utf-8'))
+        return msg
+        
+    def _send_email(self, subject, content):
+        """Send email"""
+        try:
+            with self._connect() as server:
+                server.send_message(self._build_message(subject, content))
                 
             self.logger.info(f"Email sent successfully: {subject}")
             
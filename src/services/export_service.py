@@ -0,0 +1,179 @@
+import json
+import logging
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from .health_store import get_health_store, DAY_COLUMNS, STAGE_COLUMNS
+
+FORMATS = ("npy", "npz", "parquet")
+
+# Columns that are not stored as int64
+STRING_COLUMNS = {"user_id", "device_id", "uuid"}
+DATE_COLUMNS = {"date"}
+
+class ExportService:
+    """Columnar bulk export of stored health history
+
+    Formats:
+    - npy: one .npy file per column, can be memory-mapped on load
+    - npz: single compressed NumPy archive
+    - parquet: days.parquet and stages.parquet, requires pyarrow
+    """
+    def __init__(self, store=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.store = store or get_health_store()
+
+    def export(self, path, fmt="npy", users=None, start=None, end=None):
+        """Export days and activity stages to `path`, returns the written path"""
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported export format: {fmt}")
+
+        try:
+            tables = self._collect(users, start, end)
+            path = Path(path)
+
+            if fmt == "npy":
+                self._write_npy(path, tables, users, start, end)
+            elif fmt == "npz":
+                if path.suffix != ".npz":
+                    path = path.with_suffix(".npz")
+                path.parent.mkdir(parents=True, exist_ok=True)
+                self._write_npz(path, tables)
+            else:
+                self._write_parquet(path, tables)
+
+            self.logger.info(
+                f"Exported {len(tables['days']['date'])} days and "
+                f"{len(tables['stages']['date'])} stages to {path}"
+            )
+            return path
+
+        except Exception as e:
+            self.logger.error(f"Export failed: {str(e)}")
+            raise
+
+    def export_temp_file(self, users=None, start=None, end=None):
+        """Export to an anonymous temporary npz file, rewound for reading
+
+        The file is deleted when it is closed, so the archive never has to
+        fit in memory and nothing is left behind.
+        """
+        f = tempfile.TemporaryFile(prefix="health_history_", suffix=".npz")
+        try:
+            self._write_npz(f, self._collect(users, start, end))
+            f.seek(0)
+        except Exception:
+            f.close()
+            raise
+        return f
+
+    def _collect(self, users, start, end):
+        """Read stored rows into typed column arrays"""
+        np = _require_numpy()
+        return {
+            "days": self._to_columns(np, DAY_COLUMNS, self.store.iter_days(users, start, end, DAY_COLUMNS)),
+            "stages": self._to_columns(np, STAGE_COLUMNS, self.store.iter_stages(users, start, end))
+        }
+
+    def _to_columns(self, np, columns, rows):
+        """Gather streamed rows column by column, without keeping the row tuples"""
+        values = [[] for _ in columns]
+        for row in rows:
+            for column, value in zip(values, row):
+                column.append(value)
+        arrays = {}
+        for name, column in zip(columns, values):
+            if name in DATE_COLUMNS:
+                arrays[name] = np.array(column, dtype="datetime64[D]")
+            elif name in STRING_COLUMNS:
+                arrays[name] = np.array([v or "" for v in column], dtype=str)
+            else:
+                arrays[name] = np.array([v or 0 for v in column], dtype=np.int64)
+        return arrays
+
+    def _write_npy(self, path, tables, users, start, end):
+        np = _require_numpy()
+        for table, arrays in tables.items():
+            table_dir = path / table
+            table_dir.mkdir(parents=True, exist_ok=True)
+            for name, array in arrays.items():
+                np.save(table_dir / f"{name}.npy", array, allow_pickle=False)
+
+        manifest = {
+            "format": "npy",
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "filters": {"users": users, "start": start, "end": end},
+            "tables": {
+                table: {"rows": len(arrays["date"]), "columns": list(arrays)}
+                for table, arrays in tables.items()
+            }
+        }
+        with open(path / "manifest.json", 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+
+    def _write_npz(self, target, tables):
+        np = _require_numpy()
+        np.savez_compressed(target, **{
+            f"{table}.{name}": array
+            for table, arrays in tables.items()
+            for name, array in arrays.items()
+        })
+
+    def _write_parquet(self, path, tables):
+        pa, pq = _require_pyarrow()
+        path.mkdir(parents=True, exist_ok=True)
+        for table, arrays in tables.items():
+            pq.write_table(pa.table(arrays), path / f"{table}.parquet")
+
+def load_export(path, mmap=True):
+    """Load an export as {"days": {column: array}, "stages": {column: array}}
+
+    npy exports are memory-mapped when `mmap` is set, so only the columns
+    and pages actually touched are read from disk.
+    """
+    np = _require_numpy()
+    path = Path(path)
+
+    if path.suffix == ".npz":
+        tables = {"days": {}, "stages": {}}
+        with np.load(path, allow_pickle=False) as archive:
+            for key in archive.files:
+                table, name = key.split(".", 1)
+                tables[table][name] = archive[key]
+        return tables
+
+    if (path / "manifest.json").exists():
+        with open(path / "manifest.json", 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        return {
+            table: {
+                name: np.load(path / table / f"{name}.npy", mmap_mode="r" if mmap else None, allow_pickle=False)
+                for name in info["columns"]
+            }
+            for table, info in manifest["tables"].items()
+        }
+
+    pa, pq = _require_pyarrow()
+    tables = {}
+    for table in ("days", "stages"):
+        parquet = pq.read_table(path / f"{table}.parquet", memory_map=mmap)
+        tables[table] = {
+            name: column.to_numpy()
+            for name, column in zip(parquet.column_names, parquet.columns)
+        }
+    return tables
+
+def _require_numpy():
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        raise RuntimeError("Columnar export requires numpy, install it with: pip install numpy")
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return pyarrow, pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow, install it with: pip install pyarrow")
@@ -1,18 +1,41 @@
-from openai import OpenAI
 import json
-from pathlib import Path
 import logging
-from datetime import datetime
+from .config import get_config_path
+from .recording_service import RecordingService
+from .advice_archive import get_advice_archive
+from .health_store import get_health_store, format_rollups, trend_start
+from .activity_index import get_activity_index, activity_summary, format_activity_summary, recent_range
+from .activity_index import LATE_MINUTE, MINUTES_PER_DAY
+from .advice_rules import AdviceRules, compute_metrics, significance
+from .rate_limit import get_rate_limiter
+
+# Archive key used when health data cannot be attributed to a single user
+DEFAULT_USER = "default"
+
+# Advice generation modes: rules only, LLM only, or rules unless the data changed significantly
+ADVICE_MODES = ("rules", "llm", "hybrid")
 
 class HealthAdvisorService:
     def __init__(self):
         self.logger = logging.getLogger(self.__class__.__name__)
-        self.config_path = Path(__file__).parent.parent.parent / "data" / "config.json"
+        self.config_path = get_config_path()
         self._load_config()
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url=self.base_url
-        )
+        self.recorder = RecordingService()
+        self.archive = get_advice_archive()
+        self.store = get_health_store()
+        self.rules = AdviceRules(self.step_goal, self.sleep_hours, self.deep_sleep_ratio)
+        self._client = None
+
+    @property
+    def client(self):
+        """DeepSeek client, created on first use to keep startup fast"""
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url
+            )
+        return self._client
 
     def _load_config(self):
         """Load configuration"""
@@ -30,26 +53,96 @@ class HealthAdvisorService:
                 self.sleep_hours = health_config.get("sleep_hours", {"min": 7, "max": 8})
                 self.deep_sleep_ratio = health_config.get("deep_sleep_ratio", 0.2)
                 
-                if not all([self.api_key, self.base_url, self.model]):
-                    raise ValueError("DeepSeek configuration is incomplete")
+                # Advice generation configuration
+                advice_config = config.get("advice", {})
+                self.advice_mode = advice_config.get("mode", "hybrid")
+                if self.advice_mode not in ADVICE_MODES:
+                    raise ValueError(f"Unknown advice mode: {self.advice_mode}")
+                # Significance score above which hybrid mode asks the LLM
+                self.llm_threshold = advice_config.get("llm_threshold", 1.0)
+                
+                self.llm_available = all([self.api_key, self.base_url, self.model])
+                if not self.llm_available:
+                    if self.advice_mode == "llm":
+                        raise ValueError("DeepSeek configuration is incomplete")
+                    self.logger.warning("DeepSeek configuration is incomplete, using rule-based advice")
                 
         except Exception as e:
             self.logger.error(f"Configuration error: {str(e)}")
             raise RuntimeError("Failed to load configuration")
 
-    def get_health_advice(self, health_data):
+    def get_health_advice(self, health_data, user_id=None):
         """Get health advice"""
         try:
-            # Build prompt
-            prompt = self._build_prompt(health_data)
+            user_id = user_id or self._find_user_id(health_data)
+            metrics = self._compute_metrics(health_data, user_id)
+            
+            source = self._choose_source(user_id, metrics)
+            if source == "llm":
+                try:
+                    advice_json = self._get_llm_advice(health_data, user_id)
+                except Exception as e:
+                    if self.advice_mode == "llm" or metrics is None:
+                        raise
+                    self.logger.warning(f"LLM advice failed, falling back to rules: {str(e)}")
+                    source = "rules"
+            if source == "rules":
+                advice_json = self.rules.advise(metrics)
             
-            # Call DeepSeek API
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """You are a professional health advisor. Based on the user's exercise and sleep data,
+            # Save JSON advice
+            self._save_advice(advice_json, user_id, metrics, source)
+            
+            return advice_json
+            
+        except Exception as e:
+            self.logger.error(f"Failed to get health advice: {str(e)}")
+            raise
+
+    def _compute_metrics(self, health_data, user_id):
+        """Metrics the rules and the significance score are based on"""
+        late_minutes = 0
+        if user_id:
+            try:
+                index = get_activity_index(self.store, user_id)
+                start_date, end_date = recent_range(7)
+                late_minutes = index.minutes_in_window(start_date, end_date, LATE_MINUTE, MINUTES_PER_DAY)
+            except Exception as e:
+                self.logger.error(f"Failed to count late activity: {str(e)}")
+        return compute_metrics(health_data, self.step_goal, self.sleep_hours,
+                               self.deep_sleep_ratio, late_minutes)
+
+    def _choose_source(self, user_id, metrics):
+        """Decide between rule-based and LLM advice"""
+        if self.advice_mode == "rules" or not self.llm_available:
+            if metrics is None:
+                raise ValueError("No usable health data to base advice on")
+            return "rules"
+        if metrics is None:
+            # Nothing to base rules on
+            return "llm"
+        if self.advice_mode == "llm":
+            return "llm"
+        
+        previous = self.archive.latest_from(user_id or DEFAULT_USER, "llm")
+        score = significance(metrics, previous["metrics"] if previous else None)
+        self.logger.info(f"Advice significance score: {score:.2f} (threshold {self.llm_threshold})")
+        return "llm" if score >= self.llm_threshold else "rules"
+
+    def _get_llm_advice(self, health_data, user_id):
+        """Get advice from DeepSeek"""
+        # Build prompt
+        prompt = self._build_prompt(health_data, user_id)
+        
+        # Recordings are keyed by the fetched data rather than the prompt, whose
+        # date windows and store-derived text change from day to day
+        band_data = health_data.get("summary", health_data) if isinstance(health_data, dict) else health_data
+        key = RecordingService.make_key(self.model, user_id, band_data)
+        
+        # Call DeepSeek API
+        advice = self._create_completion(key, user_id or DEFAULT_USER, [
+            {
+                "role": "system",
+                "content": """You are a professional health advisor. Based on the user's exercise and sleep data,
                          provide specific health advice. The advice should include:
                          1. What to do at specific times during the day
                          2. Improvement suggestions based on the data
@@ -66,33 +159,40 @@ class HealthAdvisorService:
                              "improvement_suggestions": ["Suggestion 1", "Suggestion 2"],
                              "achievements": ["Achievement 1", "Achievement 2"]
                          }"""
-                    },
-                    {"role": "user", "content": prompt}
-                ],
-                stream=False
-            )
-            
-            advice = response.choices[0].message.content
-            
-            # Print full response to console
-            self.logger.info("AI response content:\n" + advice)
-            
-            # Extract JSON part
-            json_str = self._extract_json(advice)
-            if not json_str:
-                raise ValueError("Unable to extract valid JSON data from response")
-            
-            # Parse JSON
-            advice_json = json.loads(json_str)
-            
-            # Save JSON advice
-            self._save_advice(json_str)
-            
-            return advice_json
-            
-        except Exception as e:
-            self.logger.error(f"Failed to get health advice: {str(e)}")
-            raise
+            },
+            {"role": "user", "content": prompt}
+        ])
+        
+        # Print full response to console
+        self.logger.info("AI response content:\n" + advice)
+        
+        # Extract JSON part
+        json_str = self._extract_json(advice)
+        if not json_str:
+            raise ValueError("Unable to extract valid JSON data from response")
+        
+        # Parse JSON
+        return json.loads(json_str)
+
+    def _create_completion(self, key, scope, messages):
+        """Run a chat completion, honoring record/replay mode for `key` within `scope`"""
+        if self.recorder.replaying:
+            body = self.recorder.replay("chat_completion", key, scope=scope)
+            if body is None:
+                raise ValueError("No recorded chat completion available for replay")
+            return json.loads(body)["choices"][0]["message"]["content"]
+        
+        get_rate_limiter().acquire(self.base_url)
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=False
+        )
+        
+        if self.recorder.recording:
+            self.recorder.record("chat_completion", key, response.model_dump_json(), scope=scope)
+        
+        return response.choices[0].message.content
 
     def _extract_json(self, text):
         """Extract JSON part from response text"""
@@ -115,8 +215,50 @@ class HealthAdvisorService:
             self.logger.error(f"Failed to extract JSON: {str(e)}")
             return None
 
-    def _build_prompt(self, health_data):
+    def _build_prompt(self, health_data, user_id=None):
         """Build prompt"""
+        return (self._build_data_prompt(health_data)
+                + self._build_activity_prompt(user_id)
+                + self._build_trend_prompt(user_id))
+
+    def _build_activity_prompt(self, user_id):
+        """Describe the exact exercise time distribution of the last 7 days"""
+        if not user_id:
+            return ""
+        try:
+            index = get_activity_index(self.store, user_id)
+            if not len(index):
+                return ""
+            start_date, end_date = recent_range(7)
+            distribution = format_activity_summary(activity_summary(index, start_date, end_date))
+        except Exception as e:
+            self.logger.error(f"Failed to build activity distribution: {str(e)}")
+            return ""
+        return f"""
+             Exercise time distribution for the last 7 days (computed from activity stages, use these exact figures):
+             {distribution}
+             """
+
+    def _build_trend_prompt(self, user_id):
+        """Describe weekly rollups of the last 90 days"""
+        if not user_id:
+            return ""
+        try:
+            trends = format_rollups(self.store.rollups(user_id, "week", start=trend_start(90)))
+        except Exception as e:
+            self.logger.error(f"Failed to load trends: {str(e)}")
+            return ""
+        if not trends:
+            return ""
+        return f"""
+             Weekly trends for the last 90 days (week starting date):
+             {trends}
+             
+             Compare the recent days with these trends when giving advice.
+             """
+
+    def _build_data_prompt(self, health_data):
+        """Build prompt for the fetched health data"""
         if isinstance(health_data, dict) and "details" in health_data:
             # Build prompt with detailed data
             return f"""
@@ -153,43 +295,19 @@ class HealthAdvisorService:
              Based on this data, provide specific time-based recommendations and improvement plans.
              """
 
-    def _save_advice(self, advice_json):
-        """Save advice to file"""
+    def _save_advice(self, advice, user_id=None, metrics=None, source=None):
+        """Append advice to the advice archive"""
         try:
-            advice_dir = Path("data_export/advice")
-            advice_dir.mkdir(exist_ok=True, parents=True)
-            
-            # Clean up old files
-            for old_file in advice_dir.glob("health_advice_*.txt"):
-                old_file.unlink()
-            
-            date_str = datetime.now().strftime("%Y%m%d")
-            filename = advice_dir / f"health_advice_{date_str}.txt"
-            
-            # Parse advice JSON
-            advice = json.loads(advice_json)
-            
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write("=== Health Advice ===\n\n")
-                f.write("Daily Reminders:\n")
-                for notification in advice["notifications"]:
-                    f.write(f"[{notification['time']}] {notification['message']}\n")
-                
-                f.write("\nDaily Summary:\n")
-                f.write(advice["daily_summary"])
-                
-                f.write("\n\nImprovement Suggestions:\n")
-                for suggestion in advice["improvement_suggestions"]:
-                    f.write(f"- {suggestion}\n")
-                
-                f.write("\nAchievements:\n")
-                for achievement in advice["achievements"]:
-                    f.write(f"- {achievement}\n")
-                
-                f.write("\n\n=== Raw Data ===\n")
-                f.write(advice_json)
-                
-            self.logger.info(f"Health advice saved to: {filename}")
+            self.archive.append(user_id or DEFAULT_USER, advice, metrics=metrics, source=source)
             
         except Exception as e:
-            self.logger.error(f"Failed to save advice: {str(e)}") 
\ No newline at end of file
+            self.logger.error(f"Failed to save advice: {str(e)}")
+
+    def _find_user_id(self, health_data):
+        """Get the Zepp user id the health data belongs to"""
+        if isinstance(health_data, dict) and "summary" in health_data:
+            health_data = health_data["summary"]
+        if not isinstance(health_data, dict):
+            return None
+        user_ids = {str(item["uid"]) for item in health_data.get("data") or [] if "uid" in item}
+        return user_ids.pop() if len(user_ids) == 1 else None
@@ -0,0 +1,558 @@
+import sqlite3
+import threading
+import logging
+import json
+import hashlib
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from .config import get_config_path
+
+# Per-day metric columns, extracted from the decoded summary
+DAY_METRICS = [
+    "total_steps", "distance", "calories", "walk_minutes", "run_count",
+    "run_distance", "run_calories", "deep_sleep", "light_sleep", "wake_count",
+    "wake_minutes", "sleep_start", "sleep_end", "sleep_score", "resting_hr",
+    "step_goal", "tz", "sync"
+]
+
+DAY_COLUMNS = ["user_id", "date", "data_type", "source", "device_id", "uuid"] + DAY_METRICS
+
+# Metrics kept in weekly/monthly rollups
+ROLLUP_METRICS = ["total_steps", "distance", "calories", "deep_sleep", "light_sleep", "resting_hr"]
+
+# Zero means "not recorded" for these metrics, so it is left out of rollups
+SPARSE_METRICS = {"deep_sleep", "light_sleep", "resting_hr"}
+
+ROLLUP_PERIODS = ("week", "month")
+
+# Rows read per query when iterating stored days and stages
+ITER_PAGE_SIZE = 1000
+
+STAGE_COLUMNS = ["user_id", "date", "seq", "start", "stop", "mode", "distance", "calories", "steps"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS daily_summary (
+    user_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    data_type INTEGER,
+    source INTEGER,
+    device_id TEXT,
+    uuid TEXT,
+    total_steps INTEGER,
+    distance INTEGER,
+    calories INTEGER,
+    walk_minutes INTEGER,
+    run_count INTEGER,
+    run_distance INTEGER,
+    run_calories INTEGER,
+    deep_sleep INTEGER,
+    light_sleep INTEGER,
+    wake_count INTEGER,
+    wake_minutes INTEGER,
+    sleep_start INTEGER,
+    sleep_end INTEGER,
+    sleep_score INTEGER,
+    resting_hr INTEGER,
+    step_goal INTEGER,
+    tz INTEGER,
+    sync INTEGER,
+    summary TEXT,
+    digest TEXT,
+    PRIMARY KEY (user_id, date)
+);
+CREATE TABLE IF NOT EXISTS activity_stage (
+    user_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    start INTEGER,
+    stop INTEGER,
+    mode INTEGER,
+    distance INTEGER,
+    calories INTEGER,
+    steps INTEGER,
+    PRIMARY KEY (user_id, date, seq)
+);
+CREATE TABLE IF NOT EXISTS data_version (
+    user_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rollup (
+    user_id TEXT NOT NULL,
+    period TEXT NOT NULL,
+    period_start TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    days INTEGER NOT NULL,
+    total REAL,
+    mean REAL,
+    min REAL,
+    max REAL,
+    p50 REAL,
+    p90 REAL,
+    day_values TEXT NOT NULL,
+    PRIMARY KEY (user_id, period, period_start, metric)
+);
+CREATE TABLE IF NOT EXISTS account (
+    username TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    username TEXT PRIMARY KEY,
+    last_fetch REAL NOT NULL,
+    last_change REAL
+);
+"""
+
+def _int(value):
+    """Coerce upstream numeric fields (sometimes strings) to int"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+def extract_day(item, summary_json):
+    """Build a daily_summary row and its activity stages from a band_data item"""
+    slp = summary_json.get("slp", {})
+    stp = summary_json.get("stp", {})
+
+    row = {
+        "user_id": str(item.get("uid")),
+        "date": item.get("date_time"),
+        "data_type": _int(item.get("data_type")),
+        "source": _int(item.get("source")),
+        "device_id": item.get("device_id"),
+        "uuid": item.get("uuid"),
+        "total_steps": _int(stp.get("ttl")),
+        "distance": _int(stp.get("dis")),
+        "calories": _int(stp.get("cal")),
+        "walk_minutes": _int(stp.get("wk")),
+        "run_count": _int(stp.get("rn")),
+        "run_distance": _int(stp.get("runDist")),
+        "run_calories": _int(stp.get("runCal")),
+        "deep_sleep": _int(slp.get("dp")),
+        "light_sleep": _int(slp.get("lt")),
+        "wake_count": _int(slp.get("wk")),
+        "wake_minutes": _int(slp.get("wc")),
+        "sleep_start": _int(slp.get("st")),
+        "sleep_end": _int(slp.get("ed")),
+        "sleep_score": _int(slp.get("ss")),
+        "resting_hr": _int(slp.get("rhr")),
+        "step_goal": _int(summary_json.get("goal")),
+        "tz": _int(summary_json.get("tz")),
+        "sync": _int(summary_json.get("sync"))
+    }
+
+    stages = [
+        (
+            seq,
+            _int(stage.get("start")),
+            _int(stage.get("stop")),
+            _int(stage.get("mode")),
+            _int(stage.get("dis")),
+            _int(stage.get("cal")),
+            _int(stage.get("step"))
+        )
+        for seq, stage in enumerate(stp.get("stage", []))
+    ]
+    return row, stages
+
+def period_start(period, date):
+    """First day of the week (Monday) or month containing `date`"""
+    day = datetime.strptime(date, "%Y-%m-%d")
+    if period == "week":
+        day -= timedelta(days=day.weekday())
+    else:
+        day = day.replace(day=1)
+    return day.strftime("%Y-%m-%d")
+
+def _percentile(ordered, pct):
+    """Linearly interpolated percentile of a sorted list"""
+    if len(ordered) == 1:
+        return float(ordered[0])
+    position = (len(ordered) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def _rollup_stats(day_values):
+    values = sorted(day_values.values())
+    if not values:
+        return 0, None, None, None, None, None, None
+    total = float(sum(values))
+    return (
+        len(values), total, total / len(values), float(values[0]), float(values[-1]),
+        _percentile(values, 50), _percentile(values, 90)
+    )
+
+# (metric, label, unit) used when describing rollups in prompts and emails
+ROLLUP_LABELS = [
+    ("total_steps", "steps", ""),
+    ("distance", "distance", " m"),
+    ("calories", "calories", " kcal"),
+    ("deep_sleep", "deep sleep", " min"),
+    ("light_sleep", "light sleep", " min"),
+    ("resting_hr", "resting HR", " bpm")
+]
+
+def format_rollups(periods):
+    """Describe rollup periods as one line of text per period"""
+    lines = []
+    for entry in periods:
+        parts = []
+        for metric, label, unit in ROLLUP_LABELS:
+            stats = entry.get(metric)
+            if stats and stats["days"]:
+                parts.append(
+                    f"{label} avg {stats['mean']:,.0f}{unit} "
+                    f"(p50 {stats['p50']:,.0f}, p90 {stats['p90']:,.0f}, {stats['days']} days)"
+                )
+        if parts:
+            lines.append(f"{entry['period_start']}: " + "; ".join(parts))
+    return "\n".join(lines)
+
+def trend_start(days=90):
+    """Start date of a trailing window of `days` days"""
+    return (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+
+class HealthStore:
+    """Local SQLite store of decoded per-user, per-day health data"""
+    def __init__(self, path=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.path = Path(path) if path else _configured_store_path()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._ensure_rollups()
+
+    def _ensure_rollups(self):
+        """Build rollups for stores created before rollups existed"""
+        with self._lock:
+            has_rollups = self._conn.execute("SELECT 1 FROM rollup LIMIT 1").fetchone()
+            has_days = self._conn.execute("SELECT 1 FROM daily_summary LIMIT 1").fetchone()
+        if has_days and not has_rollups:
+            self.rebuild_rollups()
+
+    def ingest(self, data):
+        """Store the decoded items of a processed band_data response
+
+        Items must have been through MiFitService._process_data. Days whose
+        raw summary is unchanged are skipped. Returns the changed (user_id, date) pairs.
+        """
+        days = []
+        for item in data.get("data") or []:
+            if "summary_decoded" not in item:
+                continue
+            row, stages = extract_day(item, item["summary_decoded"])
+            row["summary"] = json.dumps(item["summary_decoded"], ensure_ascii=False)
+            row["digest"] = hashlib.sha1(item["summary"].encode('utf-8')).hexdigest()
+            days.append((row, stages))
+        return self.upsert_days(days)
+
+    def upsert_days(self, days):
+        """Insert or replace days given as (row, stages) pairs"""
+        changed = []
+        changed_rows = []
+        columns = DAY_COLUMNS + ["summary", "digest"]
+        insert_day = (
+            f"INSERT OR REPLACE INTO daily_summary ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)})"
+        )
+
+        with self._lock, self._conn:
+            for row, stages in days:
+                key = (row["user_id"], row["date"])
+                existing = self._conn.execute(
+                    "SELECT digest FROM daily_summary WHERE user_id = ? AND date = ?", key
+                ).fetchone()
+                if existing and existing["digest"] == row["digest"]:
+                    continue
+
+                self._conn.execute(insert_day, [row.get(c) for c in columns])
+                self._conn.execute("DELETE FROM activity_stage WHERE user_id = ? AND date = ?", key)
+                self._conn.executemany(
+                    "INSERT INTO activity_stage VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [key + stage for stage in stages]
+                )
+                changed.append(key)
+                changed_rows.append(row)
+
+            self._update_rollups(changed_rows)
+
+            for user_id in {user_id for user_id, _ in changed}:
+                self._conn.execute(
+                    "INSERT INTO data_version (user_id, version) VALUES (?, 1) "
+                    "ON CONFLICT(user_id) DO UPDATE SET version = version + 1",
+                    (user_id,)
+                )
+
+        if changed:
+            self.logger.info(f"Stored {len(changed)} changed days")
+        return changed
+
+    def _update_rollups(self, rows):
+        """Fold changed days into their weekly and monthly rollups
+
+        Each rollup keeps its per-day values (at most 31), so replacing a
+        day and recomputing totals, means and percentiles is O(period length)
+        and never rereads the daily table.
+        """
+        pending = {}
+        for row in rows:
+            for period in ROLLUP_PERIODS:
+                key = (row["user_id"], period, period_start(period, row["date"]))
+                pending.setdefault(key, []).append(row)
+
+        for (user_id, period, start), period_rows in pending.items():
+            existing = {
+                r["metric"]: json.loads(r["day_values"])
+                for r in self._conn.execute(
+                    "SELECT metric, day_values FROM rollup WHERE user_id = ? AND period = ? AND period_start = ?",
+                    (user_id, period, start)
+                )
+            }
+            for metric in ROLLUP_METRICS:
+                day_values = existing.get(metric, {})
+                for row in period_rows:
+                    value = row.get(metric) or 0
+                    if metric in SPARSE_METRICS and not value:
+                        day_values.pop(row["date"], None)
+                    else:
+                        day_values[row["date"]] = value
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rollup VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (user_id, period, start, metric) + _rollup_stats(day_values) + (json.dumps(day_values),)
+                )
+
+    def rebuild_rollups(self, user_id=None):
+        """Recompute rollups from the daily table"""
+        users = [user_id] if user_id else None
+        where, params = self._range_filter(users, None, None)
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM rollup {where}", params)
+            rows = self._conn.execute(
+                f"SELECT user_id, date, {', '.join(ROLLUP_METRICS)} FROM daily_summary {where}", params
+            ).fetchall()
+            self._update_rollups([dict(row) for row in rows])
+        self.logger.info(f"Rebuilt rollups from {len(rows)} days")
+
+    def rollups(self, user_id, period="week", start=None, end=None, metrics=None):
+        """Get materialized rollups, one dict per period ordered by period start
+
+        Each dict maps metric name to {days, total, mean, min, max, p50, p90}.
+        """
+        if period not in ROLLUP_PERIODS:
+            raise ValueError(f"Unknown rollup period: {period}")
+        metrics = metrics or ROLLUP_METRICS
+        query = (
+            f"SELECT period_start, metric, days, total, mean, min, max, p50, p90 FROM rollup "
+            f"WHERE user_id = ? AND period = ? AND metric IN ({', '.join('?' for _ in metrics)})"
+        )
+        params = [user_id, period] + list(metrics)
+        if start:
+            query += " AND period_start >= ?"
+            params.append(period_start(period, start))
+        if end:
+            query += " AND period_start <= ?"
+            params.append(end)
+
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY period_start", params).fetchall()
+
+        periods = {}
+        for row in rows:
+            entry = periods.setdefault(row["period_start"], {"period_start": row["period_start"]})
+            entry[row["metric"]] = {
+                name: row[name] for name in ("days", "total", "mean", "min", "max", "p50", "p90")
+            }
+        return list(periods.values())
+
+    def link_account(self, username, user_id):
+        """Remember which Zepp user id belongs to a configured account"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO account (username, user_id) VALUES (?, ?)",
+                (username, str(user_id))
+            )
+
+    def user_for_account(self, username):
+        """Get the Zepp user id of a configured account, None if never fetched"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT user_id FROM account WHERE username = ?", (username,)
+            ).fetchone()
+        return row["user_id"] if row else None
+
+    def record_fetch(self, username, changed):
+        """Record a fetch for an account and whether it changed any stored day"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO sync_state (username, last_fetch, last_change) VALUES (?, ?, ?) "
+                "ON CONFLICT(username) DO UPDATE SET last_fetch = excluded.last_fetch, "
+                "last_change = COALESCE(excluded.last_change, sync_state.last_change)",
+                (username, now, now if changed else None)
+            )
+
+    def sync_state(self, username):
+        """Get {"last_fetch", "last_change"} epoch seconds of an account, None if never fetched"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_fetch, last_change FROM sync_state WHERE username = ?", (username,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def last_device_sync(self, user_id):
+        """Newest device sync timestamp among a user's stored days, None if unknown"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(sync) AS sync FROM daily_summary WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return row["sync"] if row and row["sync"] else None
+
+    def average_steps(self, user_id, start):
+        """Mean daily steps of a user since `start`, 0 without data"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT AVG(total_steps) AS steps FROM daily_summary WHERE user_id = ? AND date >= ?",
+                (user_id, start)
+            ).fetchone()
+        return row["steps"] or 0
+
+    def first_date(self, user_id):
+        """Oldest stored date for a user"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(date) AS date FROM daily_summary WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return row["date"] if row else None
+
+    def latest_date(self, user_id):
+        """Most recent stored date for a user"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(date) AS date FROM daily_summary WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return row["date"] if row else None
+
+    def users(self):
+        """List user ids with stored data"""
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id FROM data_version ORDER BY user_id").fetchall()
+        return [row["user_id"] for row in rows]
+
+    def data_version(self, user_id):
+        """Version counter, incremented whenever a user's stored data changes"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version FROM data_version WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return row["version"] if row else 0
+
+    def _range_filter(self, users, start, end):
+        clauses, params = [], []
+        if users:
+            clauses.append(f"user_id IN ({', '.join('?' for _ in users)})")
+            params.extend(users)
+        if start:
+            clauses.append("date >= ?")
+            params.append(start)
+        if end:
+            clauses.append("date <= ?")
+            params.append(end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def count_days(self, users=None, start=None, end=None):
+        where, params = self._range_filter(users, start, end)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM daily_summary {where}", params).fetchone()[0]
+
+    def count_stages(self, users=None, start=None, end=None):
+        where, params = self._range_filter(users, start, end)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM activity_stage {where}", params).fetchone()[0]
+
+    def iter_days(self, users=None, start=None, end=None, columns=None):
+        """Yield stored days as tuples of `columns`, ordered by user and date"""
+        return self._iter_pages("daily_summary", columns or DAY_COLUMNS, ("user_id", "date"), users, start, end)
+
+    def _iter_pages(self, table, columns, keys, users, start, end):
+        """Yield rows of `columns` ordered by `keys`, reading one page at a time
+
+        Pages continue after the keys of the previous page's last row, so
+        only one page is in memory and the lock is not held between pages.
+        """
+        where, params = self._range_filter(users, start, end)
+        select = ", ".join(list(keys) + list(columns))
+        order = ", ".join(keys)
+        after = None
+        while True:
+            clause, page_params = where, list(params)
+            if after:
+                clause += (" AND " if clause else "WHERE ") + f"({order}) > ({', '.join('?' for _ in keys)})"
+                page_params.extend(after)
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT {select} FROM {table} {clause} ORDER BY {order} LIMIT ?",
+                    page_params + [ITER_PAGE_SIZE]
+                ).fetchall()
+            for row in rows:
+                yield tuple(row)[len(keys):]
+            if len(rows) < ITER_PAGE_SIZE:
+                return
+            after = tuple(rows[-1])[:len(keys)]
+
+    def query_days(self, fields, users=None, start=None, end=None, after=None, limit=100):
+        """Page through stored days, projecting only `fields`
+
+        Pages are ordered by (user_id, date) and `after` is the (user_id, date)
+        of the last row of the previous page. Returns rows as tuples of
+        (user_id, date, *fields).
+        """
+        unknown = [f for f in fields if f not in DAY_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+        where, params = self._range_filter(users, start, end)
+        if after:
+            where += (" AND " if where else "WHERE ") + "(user_id, date) > (?, ?)"
+            params.extend(after)
+        columns = ["user_id", "date"] + [f for f in fields if f not in ("user_id", "date")]
+
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT {', '.join(columns)} FROM daily_summary {where} "
+                f"ORDER BY user_id, date LIMIT ?", params + [limit]
+            ).fetchall()
+
+    def iter_stages(self, users=None, start=None, end=None):
+        """Yield stored activity stages as tuples of STAGE_COLUMNS"""
+        return self._iter_pages("activity_stage", STAGE_COLUMNS, ("user_id", "date", "seq"), users, start, end)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def _configured_store_path():
+    """Get the store path from the "store" config section"""
+    try:
+        with open(get_config_path(), 'r') as f:
+            config = json.load(f)
+    except Exception:
+        config = {}
+    return Path(config.get("store", {}).get("path", "data_export/health_store.db"))
+
+def get_health_store(path=None):
+    """Get the shared HealthStore instance for a database path"""
+    resolved = Path(path) if path else _configured_store_path()
+    key = str(resolved.resolve())
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = HealthStore(resolved)
+        return _stores[key]
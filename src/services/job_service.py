@@ -0,0 +1,163 @@
+import json
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from .config import get_config_path
+from .profiling_service import get_profiler
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+class Job:
+    """A unit of background work with observable progress"""
+    def __init__(self, kind, key, condition):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.status = QUEUED
+        self.progress = 0
+        self.message = "Queued"
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now().isoformat(timespec="seconds")
+        self.finished_at = None
+        # Incremented on every change, lets watchers wait for updates
+        self.revision = 0
+        self._condition = condition
+
+    @property
+    def done(self):
+        return self.status in (SUCCEEDED, FAILED)
+
+    def update(self, progress=None, message=None, **changes):
+        """Record progress and wake up watchers"""
+        with self._condition:
+            if progress is not None:
+                self.progress = progress
+            if message is not None:
+                self.message = message
+            for name, value in changes.items():
+                setattr(self, name, value)
+            self.revision += 1
+            self._condition.notify_all()
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "message": self.message,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at
+        }
+
+class JobService:
+    """Run background jobs on a bounded thread pool
+
+    Submitting a job whose key matches a job that is still queued or running
+    joins that job instead of starting a second one. The same executor is
+    used by web requests and scheduled tasks.
+    """
+    def __init__(self, max_workers=4, history=100):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.history = history
+        self._condition = threading.Condition()
+        self._jobs = OrderedDict()
+        self._active = {}
+
+    def submit(self, kind, fn, key=None, on_join=None):
+        """Start `fn(job)` in the background, or join the active job with the same key
+
+        `on_join()` is called instead when the active job is joined, so a
+        caller can release what it set aside for `fn`.
+        """
+        with self._condition:
+            if key is not None and key in self._active:
+                job = self._active[key]
+                self.logger.debug(f"Joining active {kind} job {job.id}")
+                if on_join:
+                    on_join()
+                return job
+
+            job = Job(kind, key, self._condition)
+            self._jobs[job.id] = job
+            if key is not None:
+                self._active[key] = job
+            self._trim()
+
+        self.executor.submit(self._run, job, fn)
+        self.logger.info(f"Submitted {kind} job {job.id}")
+        return job
+
+    def _run(self, job, fn):
+        job.update(message="Running", status=RUNNING)
+        try:
+            with get_profiler().profile(f"job:{job.kind}"):
+                result = fn(job)
+            self._finish(job, 100, "Completed", status=SUCCEEDED, result=result)
+        except Exception as e:
+            self.logger.error(f"Job {job.id} failed: {str(e)}")
+            self._finish(job, message="Failed", status=FAILED, error=str(e))
+
+    def _finish(self, job, progress=None, message=None, **changes):
+        """Record the final state and stop joining the job in one step
+
+        A submit() seeing the job still active always gets a job that has
+        not finished yet.
+        """
+        with self._condition:
+            job.update(progress, message, finished_at=datetime.now().isoformat(timespec="seconds"), **changes)
+            if self._active.get(job.key) is job:
+                del self._active[job.key]
+
+    def _trim(self):
+        """Forget the oldest finished jobs beyond the history limit"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(self._jobs) - self.history)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def active(self, key):
+        """The queued or running job with `key`, or None"""
+        with self._condition:
+            return self._active.get(key)
+
+    def wait(self, job, revision, timeout=15):
+        """Block until the job changes past `revision` or the timeout expires"""
+        with self._condition:
+            self._condition.wait_for(lambda: job.revision != revision or job.done, timeout=timeout)
+            return job.to_dict(), job.revision
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+_job_service = None
+_job_service_lock = threading.Lock()
+
+def get_job_service():
+    """Get the process-wide JobService, configured by the "jobs" config section"""
+    global _job_service
+    with _job_service_lock:
+        if _job_service is None:
+            try:
+                with open(get_config_path(), 'r') as f:
+                    jobs_config = json.load(f).get("jobs", {})
+            except Exception:
+                jobs_config = {}
+            _job_service = JobService(
+                max_workers=jobs_config.get("max_workers", 4),
+                history=jobs_config.get("history", 100)
+            )
+        return _job_service
@@ -0,0 +1,100 @@
+import codecs
+import json
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+# Characters that may continue a number, e.g. "12" followed by ".5" in the next chunk
+_NUMBER_CHARS = "0123456789.eE+-"
+
+class JsonArrayStream:
+    """Iterate the items of one array field of a JSON object as bytes arrive
+
+    Only the current item and one unread chunk are held in memory, so a
+    response with any number of items is parsed in constant memory. The
+    object's other top-level fields are collected in `fields`.
+    """
+    def __init__(self, chunks, key="data"):
+        self.chunks = iter(chunks)
+        self.key = key
+        self.fields = {}
+        self.found = False
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        """Append the next chunk to the buffer, dropping what was consumed"""
+        if self._eof:
+            return
+        self._buf = self._buf[self._pos:]
+        self._pos = 0
+        for chunk in self.chunks:
+            if chunk:
+                self._buf += self._text.decode(chunk)
+                return
+        self._buf += self._text.decode(b"", final=True)
+        self._eof = True
+
+    def _peek(self):
+        """Next non-whitespace character, None at the end of the stream"""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if self._eof:
+                return None
+            self._fill()
+
+    def _expect(self, chars):
+        char = self._peek()
+        if char is None or char not in chars:
+            raise ValueError(f"Malformed JSON stream: expected one of {chars!r}, got {char!r}")
+        self._pos += 1
+        return char
+
+    def _value(self):
+        """Decode the next complete JSON value"""
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            else:
+                # A number at the end of the buffer may continue in the next chunk
+                if self._eof or (end < len(self._buf) and self._buf[end] not in _NUMBER_CHARS):
+                    self._pos = end
+                    return value
+            self._fill()
+
+    def __iter__(self):
+        self._expect("{")
+        closed = self._peek() == "}"
+        if closed:
+            self._pos += 1
+        while not closed:
+            key = self._value()
+            self._expect(":")
+            if key == self.key and self._peek() == "[":
+                self.found = True
+                yield from self._items()
+            else:
+                self.fields[key] = self._value()
+            closed = self._expect(",}") == "}"
+        # Drain the stream, so wrapped chunk iterators (e.g. recording) see the end
+        if self._peek() is not None:
+            raise ValueError("Malformed JSON stream: unexpected data after the object")
+
+    def _items(self):
+        self._expect("[")
+        if self._peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self._value()
+            if self._expect(",]") == "]":
+                return
@@ -0,0 +1,177 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from pathlib import Path
+from .config import get_config_path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lease (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS member (
+    holder TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS task_run (
+    task TEXT NOT NULL,
+    slot TEXT NOT NULL,
+    holder TEXT NOT NULL,
+    claimed_at TEXT NOT NULL,
+    PRIMARY KEY (task, slot)
+);
+"""
+
+# Coordination modes: one leader runs all scheduled work, or work is hash-sharded across members
+COORDINATION_MODES = ("leader", "shard")
+
+# Name of the lease held by the scheduler leader
+LEADER_LEASE = "scheduler"
+
+def _shard_owner(key, members):
+    """Pick the member owning a key with rendezvous hashing
+
+    Adding or removing a member only moves the keys it owned.
+    """
+    return max(members, key=lambda member: zlib.crc32(f"{member}:{key}".encode("utf-8")))
+
+class LeaseService:
+    """Scheduler coordination between processes through a shared SQLite file
+
+    Each process heartbeats a membership row and tries to take or renew
+    the leader lease, which expires after `ttl` seconds without renewal so
+    another process takes over. Task slots are claimed at most once across
+    all processes, which keeps failover and overlapping leaders from
+    running the same scheduled work twice. SQLite locking only holds
+    between processes on one host, so the file must be on local disk, not
+    a network share.
+    """
+    def __init__(self, path=None, holder=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.config_path = get_config_path()
+        self._load_config()
+        if path:
+            self.path = Path(path)
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.path), timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._leader = False
+        self._members = []
+
+    def _load_config(self):
+        """Load coordination configuration"""
+        try:
+            with open(self.config_path, 'r') as f:
+                config = json.load(f)
+        except Exception:
+            config = {}
+
+        coordination_config = config.get("coordination", {})
+        self.path = Path(coordination_config.get("path", "data_export/coordination.db"))
+        self.mode = coordination_config.get("mode", "leader")
+        if self.mode not in COORDINATION_MODES:
+            raise ValueError(f"Unknown coordination mode: {self.mode}")
+        # Seconds a lease or membership stays valid without a heartbeat
+        self.ttl = coordination_config.get("ttl", 60)
+        # Days of task claims to keep
+        self.claim_retention_days = coordination_config.get("claim_retention_days", 7)
+
+    @property
+    def heartbeat_interval(self):
+        return max(1, self.ttl / 3)
+
+    @property
+    def is_leader(self):
+        return self._leader
+
+    def heartbeat(self):
+        """Renew membership and the leader lease
+
+        Returns True when leadership or membership changed since the last
+        heartbeat, the caller should then re-check which work it owns.
+        """
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO member (holder, expires_at) VALUES (?, ?)",
+                    (self.holder, expires_at)
+                )
+                self._conn.execute("DELETE FROM member WHERE expires_at < ?", (now,))
+                # Take the lease if it is free, expired or already ours
+                self._conn.execute(
+                    "INSERT INTO lease (name, holder, expires_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at "
+                    "WHERE lease.expires_at < ? OR lease.holder = excluded.holder",
+                    (LEADER_LEASE, self.holder, expires_at, now)
+                )
+                holder = self._conn.execute(
+                    "SELECT holder FROM lease WHERE name = ?", (LEADER_LEASE,)
+                ).fetchone()["holder"]
+                members = [row["holder"] for row in self._conn.execute("SELECT holder FROM member ORDER BY holder")]
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        leader = holder == self.holder
+        changed = leader != self._leader or members != self._members
+        if leader != self._leader:
+            self.logger.info(f"{self.holder} {'became' if leader else 'is no longer'} scheduler leader")
+        self._leader = leader
+        self._members = members
+        return changed
+
+    def owns(self, key):
+        """Whether this process should run scheduled work for `key`"""
+        if self.mode == "leader":
+            return self._leader
+        return bool(self._members) and _shard_owner(key, self._members) == self.holder
+
+    def claim(self, task, slot):
+        """Claim a task slot, True for exactly one caller across all processes"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO task_run (task, slot, holder, claimed_at) VALUES (?, ?, ?, ?)",
+                (task, slot, self.holder, datetime.now().isoformat(timespec="seconds"))
+            )
+        return cursor.rowcount == 1
+
+    def unclaim(self, task, slot):
+        """Give back a claim of this process, e.g. when the task failed and should run again"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM task_run WHERE task = ? AND slot = ? AND holder = ?", (task, slot, self.holder)
+            )
+
+    def prune_claims(self):
+        """Forget task claims older than the retention period"""
+        cutoff = (datetime.now() - timedelta(days=self.claim_retention_days)).isoformat(timespec="seconds")
+        with self._lock:
+            self._conn.execute("DELETE FROM task_run WHERE claimed_at < ?", (cutoff,))
+
+    def release(self):
+        """Give up the lease and membership, e.g. on shutdown"""
+        with self._lock:
+            self._conn.execute("DELETE FROM lease WHERE name = ? AND holder = ?", (LEADER_LEASE, self.holder))
+            self._conn.execute("DELETE FROM member WHERE holder = ?", (self.holder,))
+        self._leader = False
+        self._members = []
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,21 +1,47 @@
 import requests
 import logging
 import json
-from pathlib import Path
 import base64
 from datetime import datetime, timedelta
+from .config import get_config_path
+from .recording_service import RecordingService
+from .health_store import get_health_store
+from .decode_service import DecodeService
+from .rate_limit import get_rate_limiter
+from .json_stream import JsonArrayStream
+
+# Bytes read from the band_data response at a time when streaming
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Default Zepp(Mi Fit) endpoints, can be overridden by the "zepp" config section
+DEFAULT_ENDPOINTS = {
+    "auth_url": "https://api-user.huami.com",
+    "account_url": "https://account.huami.com",
+    "api_url": "https://api-mifit.huami.com"
+}
 
 class MiFitService:
     """Service for interacting with Zepp(Mi Fit) API"""
-    def __init__(self, proxies=None):
+    def __init__(self, proxies=None, username=None, password=None):
         self.logger = logging.getLogger(self.__class__.__name__)
-        self.config_path = Path(__file__).parent.parent.parent / "data" / "config.json"
+        self.config_path = get_config_path()
         self.user_agent = "Mozilla/5.0 (iPhone; CPU iPhone OS 13_4_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 MicroMessenger/7.0.12(0x17000c2d) NetType/WIFI Language/zh_CN"
         self.session = requests.Session()
         if proxies:
             self.session.proxies = proxies
         self.proxies = proxies
         self._load_config()
+        self.recorder = RecordingService()
+        self.store = get_health_store()
+        self.limiter = get_rate_limiter()
+        self._auth = None
+        # (user_id, date) pairs changed by the last get_health_data call
+        self.changed_days = []
+        # Explicit credentials take precedence over config file
+        if username:
+            self.username = username
+        if password:
+            self.password = password
 
     def _load_config(self):
         """Load user credentials from config file"""
@@ -24,6 +50,11 @@ class MiFitService:
                 config = json.load(f)
                 self.username = config["username"]
                 self.password = config["password"]
+                
+                endpoints = config.get("zepp", {})
+                self.auth_url = endpoints.get("auth_url", DEFAULT_ENDPOINTS["auth_url"]).rstrip("/")
+                self.account_url = endpoints.get("account_url", DEFAULT_ENDPOINTS["account_url"]).rstrip("/")
+                self.api_url = endpoints.get("api_url", DEFAULT_ENDPOINTS["api_url"]).rstrip("/")
         except Exception as e:
             self.logger.error(f"Configuration error: {str(e)}")
             raise RuntimeError("Failed to load configuration")
@@ -44,9 +75,10 @@ class MiFitService:
             "token": "access"
         }
         
-        url = f"https://api-user.huami.com/registrations/{self.username}/tokens"
+        url = f"{self.auth_url}/registrations/{self.username}/tokens"
         
         try:
+            self.limiter.acquire(url)
             # No need for GET request first, directly send POST request
             response = self.session.post(
                 url,
@@ -103,8 +135,9 @@ class MiFitService:
         }
         
         try:
+            self.limiter.acquire(self.account_url)
             response = self.session.post(
-                "https://account.huami.com/v2/client/login",
+                f"{self.account_url}/v2/client/login",
                 headers=headers,
                 data=data
             )
@@ -133,156 +166,146 @@ class MiFitService:
             self.logger.error(f"Login request failed: {str(e)}")
             raise Exception(f"Login failed: {str(e)}")
 
-    def get_health_data(self) -> dict:
-        """Get health data"""
+    def get_health_data(self, days=3) -> dict:
+        """Get health data for the last `days` days"""
         try:
-            # 1. Get access code
-            code = self._get_code()
-            
-            # 2. Get access token
-            login_res = self._login(code)
-            user_id, login_token, app_token = login_res
-            
-            # 3. Get activity data
             end_date = datetime.now().strftime("%Y-%m-%d")
-            start_date = (datetime.now() - timedelta(days=3)).strftime("%Y-%m-%d")
-            
-            params = {
-                "query_type": "summary",
-                "device_type": "android_phone",
-                "userid": user_id,
-                "from_date": start_date,
-                "to_date": end_date
-            }
-            
-            headers = {
-                "apptoken": app_token
-            }
-            
-            response = self.session.get(
-                "https://api-mifit.huami.com/v1/data/band_data.json",
-                params=params,
-                headers=headers
-            )
-            
-            data = response.json()
+            start_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
             
-            # Save raw response
-            self._save_raw_response(response, start_date, end_date)
+            # Serves recorded band_data without touching the network in replay mode
+            data = self._fetch_band_data(start_date, end_date)
             
             # Process data
             self._process_data(data)
             
+            # Keep decoded days in the local store
+            self.changed_days = self._store_data(data)
+            self.store.record_fetch(self.username, len(self.changed_days))
+            
             return data
             
         except Exception as e:
             self.logger.error(f"Failed to get health data: {str(e)}")
             raise
 
-    def _save_raw_response(self, response, start_date, end_date):
-        """Save detailed health data"""
-        # Clean up old files
-        data_dir = Path("data_export")
-        data_dir.mkdir(exist_ok=True)
-        for old_file in data_dir.glob("api_response_*.txt"):
-            old_file.unlink()
-            
-        filename = data_dir / f"api_response_{start_date.replace('-', '')}_{end_date.replace('-', '')}.txt"
-        
-        try:
-            data = response.json()
-            if not data.get("data"):
-                return
-                
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write(f"=== Zepp Health Data ===\n")
-                f.write(f"Statistics Period: {start_date} to {end_date}\n")
-                f.write(f"Response Status: {data.get('code')} - {data.get('message')}\n\n")
-                
-                for item in data["data"]:
-                    f.write(f"Date: {item['date_time']}\n")
-                    f.write("-" * 50 + "\n")
-                    f.write(f"User ID: {item['uid']}\n")
-                    f.write(f"Data Type: {item['data_type']}\n")
-                    f.write(f"Data Source: {item['source']}\n")
-                    f.write(f"Device ID: {item['device_id']}\n")
-                    f.write(f"UUID: {item['uuid']}\n\n")
-                    
-                    try:
-                        summary = base64.b64decode(item["summary"]).decode('utf-8')
-                        summary_json = json.loads(summary)
-                        
-                        f.write("Data Version: v" + str(summary_json.get('v', 'Unknown')) + "\n\n")
-                        
-                        # Sleep data details
-                        if "slp" in summary_json:
-                            slp = summary_json["slp"]
-                            f.write("Sleep Data Details:\n")
-                            f.write(f"  Start Timestamp: {slp.get('st')}\n")
-                            f.write(f"  End Timestamp: {slp.get('ed')}\n")
-                            f.write(f"  Deep Sleep Duration: {slp.get('dp')} minutes\n")
-                            f.write(f"  Light Sleep Duration: {slp.get('lt')} minutes\n")
-                            f.write(f"  Wake Count: {slp.get('wk')} times\n")
-                            f.write(f"  User Set Start Time: {slp.get('usrSt')} minutes\n")
-                            f.write(f"  User Set End Time: {slp.get('usrEd')} minutes\n")
-                            f.write(f"  Wake Duration: {slp.get('wc')} minutes\n")
-                            f.write(f"  Sleep State: {slp.get('is')}\n")
-                            f.write(f"  Sleep Score: {slp.get('lb')}\n")
-                            f.write(f"  Sleep Goal: {slp.get('to')} minutes\n")
-                            f.write(f"  Sleep Deviation: {slp.get('dt')} minutes\n")
-                            f.write(f"  Resting Heart Rate: {slp.get('rhr')} bpm\n")
-                            f.write(f"  Sleep Score: {slp.get('ss')}\n\n")
-                        
-                        # Step data details
-                        if "stp" in summary_json:
-                            stp = summary_json["stp"]
-                            f.write("Step Data Details:\n")
-                            f.write(f"  Total Steps: {stp.get('ttl', 0):,} steps\n")
-                            f.write(f"  Total Distance: {stp.get('dis', 0):,} meters\n")
-                            f.write(f"  Calories Burned: {stp.get('cal', 0):,} kcal\n")
-                            f.write(f"  Walking Duration: {stp.get('wk', 0)} minutes\n")
-                            f.write(f"  Running Count: {stp.get('rn', 0)} times\n")
-                            f.write(f"  Running Distance: {stp.get('runDist', 0):,} meters\n")
-                            f.write(f"  Running Calories: {stp.get('runCal', 0):,} kcal\n\n")
-                            
-                            # Activity stage details
-                            if "stage" in stp:
-                                f.write("Activity Stage Details:\n")
-                                for i, stage in enumerate(stp["stage"], 1):
-                                    f.write(f"  Stage {i}:\n")
-                                    f.write(f"    Start Time: {stage.get('start')} minutes\n")
-                                    f.write(f"    End Time: {stage.get('stop')} minutes\n")
-                                    f.write(f"    Activity Mode: {self._get_mode_description(stage.get('mode'))}\n")
-                                    f.write(f"    Distance: {stage.get('dis', 0):,} meters\n")
-                                    f.write(f"    Calories: {stage.get('cal', 0)} kcal\n")
-                                    f.write(f"    Steps: {stage.get('step', 0):,} steps\n\n")
-                        
-                        # Other data
-                        f.write("Other Data:\n")
-                        f.write(f"  Step Goal: {summary_json.get('goal', 0):,} steps\n")
-                        f.write(f"  Timezone: {summary_json.get('tz')} seconds\n")
-                        f.write(f"  Data Length: {summary_json.get('byteLength')} bytes\n")
-                        f.write(f"  Sync Timestamp: {summary_json.get('sync')} ({datetime.fromtimestamp(summary_json.get('sync', 0)/1000).strftime('%Y-%m-%d %H:%M:%S')})\n")
-                        
-                        f.write("\n" + "=" * 50 + "\n\n")
-                        
-                    except Exception as e:
-                        f.write(f"Data parsing error: {str(e)}\n\n")
+    def backfill(self, start_date, end_date=None, window_days=90, decoder=None):
+        """Fetch and store history for a long date range
+
+        Items stream in window by window and are decoded in batches large
+        enough to use every DecodeService worker, then written straight to
+        the store, so memory use does not grow with the range. Returns the
+        number of changed days.
+        """
+        changed = 0
+        with (decoder or DecodeService()) as decoder:
+            items = self.iter_band_items(start_date, end_date, window_days)
+            for batch in _batched(items, decoder.batch_size):
+                changed += self._store_decoded(decoder.decode(batch))
+                self.logger.info(f"Stored batch up to {batch[-1].get('date_time')}, {changed} changed days")
                 
-            self.logger.info(f"Detailed health data report saved to: {filename}")
+        self.logger.info(f"Backfill stored {changed} changed days")
+        return changed
+
+    def iter_band_items(self, start_date, end_date=None, window_days=90):
+        """Yield band_data items of a date range, parsed as each window's response streams in"""
+        end_date = end_date or datetime.now().strftime("%Y-%m-%d")
+        window_start = datetime.strptime(start_date, "%Y-%m-%d")
+        last_day = datetime.strptime(end_date, "%Y-%m-%d")
+        
+        while window_start <= last_day:
+            window_end = min(window_start + timedelta(days=window_days - 1), last_day)
+            from_date = window_start.strftime("%Y-%m-%d")
+            to_date = window_end.strftime("%Y-%m-%d")
             
-        except Exception as e:
-            self.logger.error(f"Failed to save data: {str(e)}")
+            stream = JsonArrayStream(self._band_data_chunks(from_date, to_date), "data")
+            yield from stream
+            if not stream.found:
+                self.logger.warning(f"No band data from {from_date} to {to_date}: {stream.fields}")
+            window_start = window_end + timedelta(days=1)
+
+    def _store_decoded(self, days):
+        """Write decoded (row, stages) pairs to the store"""
+        user_ids = {row["user_id"] for row, _ in days}
+        if len(user_ids) == 1:
+            self.store.link_account(self.username, user_ids.pop())
+        return len(self.store.upsert_days(days))
 
-    def _get_mode_description(self, mode):
-        """Get activity mode description"""
-        modes = {
-            1: "Walking",
-            3: "Fast Walking",
-            4: "Running",
-            5: "Cycling"
+    def _authenticate(self):
+        """Log in once per service instance, returns (user_id, app_token)"""
+        if self._auth is None:
+            # 1. Get access code
+            code = self._get_code()
+            
+            # 2. Get access token
+            user_id, login_token, app_token = self._login(code)
+            self._auth = (user_id, app_token)
+        return self._auth
+
+    def _fetch_band_data(self, start_date, end_date):
+        """Fetch band_data for a date range as a dict
+
+        The body is parsed as it streams in, but every item is kept, so this
+        is for the short ranges of get_health_data. Long ranges go through
+        iter_band_items, which keeps memory bounded.
+        """
+        stream = JsonArrayStream(self._band_data_chunks(start_date, end_date), "data")
+        items = list(stream)
+        data = dict(stream.fields)
+        if stream.found:
+            data["data"] = items
+        return data
+
+    def _band_data_chunks(self, start_date, end_date):
+        """Yield the raw band_data response body in chunks, honoring record/replay mode"""
+        key = self._recording_key(start_date, end_date)
+        if self.recorder.replaying:
+            body = self.recorder.open_replay("band_data", key, scope=self.username)
+            if body is None:
+                raise Exception("No recorded band_data response available for replay")
+            with body:
+                yield from iter(lambda: body.read(STREAM_CHUNK_SIZE), b"")
+            return
+        
+        user_id, app_token = self._authenticate()
+        
+        # 3. Get activity data
+        params = {
+            "query_type": "summary",
+            "device_type": "android_phone",
+            "userid": user_id,
+            "from_date": start_date,
+            "to_date": end_date
         }
-        return modes.get(mode, f"Unknown mode({mode})")
+        
+        headers = {
+            "apptoken": app_token
+        }
+        
+        self.limiter.acquire(self.api_url)
+        with self.session.get(
+            f"{self.api_url}/v1/data/band_data.json",
+            params=params,
+            headers=headers,
+            stream=True
+        ) as response:
+            chunks = response.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+            if self.recorder.recording:
+                chunks = self.recorder.record_stream("band_data", key, chunks, scope=self.username)
+            yield from chunks
+
+    def _recording_key(self, start_date, end_date):
+        return f"{self.username}:{start_date}:{end_date}"
+
+    def _store_data(self, data):
+        """Ingest processed data into the local store"""
+        try:
+            user_ids = {str(item["uid"]) for item in data.get("data") or [] if "uid" in item}
+            if len(user_ids) == 1:
+                self.store.link_account(self.username, user_ids.pop())
+            return self.store.ingest(data)
+        except Exception as e:
+            self.logger.error(f"Failed to store health data: {str(e)}")
+            return []
 
     def _process_data(self, data):
         """Process data"""
@@ -311,4 +334,15 @@ class MiFitService:
                 
             except Exception as e:
                 self.logger.error(f"Failed to process data: {str(e)}")
-                item["parse_error"] = str(e) 
\ No newline at end of file
+                item["parse_error"] = str(e) 
+
+def _batched(items, size):
+    """Group an iterable into lists of up to `size` items"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,114 @@
+import json
+import logging
+import threading
+from .config import get_config_path
+
+IMMEDIATE = "immediate"
+DIGEST = "digest"
+
+def _minutes(time):
+    """Minutes after midnight of an "HH:MM" time"""
+    hour, minute = time.split(":")
+    return int(hour) * 60 + int(minute)
+
+def _time(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+class Delivery:
+    """Reminders sent to one recipient in one email"""
+    def __init__(self, username, time, notifications, receiver_email=None):
+        self.username = username
+        self.time = time
+        self.notifications = notifications
+        self.receiver_email = receiver_email
+
+    @property
+    def key(self):
+        """Identifies the delivery for at-most-once claims"""
+        messages = "|".join(f"{n['time']} {n['message']}" for n in self.notifications)
+        return f"{self.username}:{self.time}:{messages}"
+
+    def render(self):
+        """(subject, content) of the email"""
+        if len(self.notifications) == 1:
+            notification = self.notifications[0]
+            return f"Health Reminder: {notification['time']} Health Advice", notification["message"]
+
+        last = self.notifications[-1]["time"]
+        subject = f"Health Reminders: {self.time}-{last} Health Advice"
+        content = "\n\n".join(f"{n['time']}  {n['message']}" for n in self.notifications)
+        return subject, content
+
+class NotificationService:
+    """Plan when each user's reminders are emailed
+
+    Users in digest mode get reminders falling within `digest_window_minutes`
+    of each other in one email, sent at the earliest reminder's time so
+    none arrives late. Users in immediate mode get each reminder at its own
+    time. Everything due in the same minute is handed out together, so it
+    can be delivered over one SMTP connection.
+    """
+    def __init__(self):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.config_path = get_config_path()
+        self._load_config()
+        self._plans = {}
+        self._lock = threading.Lock()
+
+    def _load_config(self):
+        """Load notification preferences"""
+        try:
+            with open(self.config_path, 'r') as f:
+                config = json.load(f)
+        except Exception:
+            config = {}
+
+        notification_config = config.get("notifications", {})
+        self.mode = notification_config.get("mode", IMMEDIATE)
+        self.digest_window_minutes = notification_config.get("digest_window_minutes", 60)
+        # Per-account overrides of mode, digest_window_minutes and receiver_email
+        self.users = notification_config.get("users", {})
+
+    def preference(self, username):
+        """(mode, digest window, receiver email) for an account"""
+        user = self.users.get(username, {})
+        mode = user.get("mode", self.mode)
+        if mode not in (IMMEDIATE, DIGEST):
+            raise ValueError(f"Unknown notification mode for {username}: {mode}")
+        return mode, user.get("digest_window_minutes", self.digest_window_minutes), user.get("receiver_email")
+
+    def set_notifications(self, username, notifications):
+        """Replace an account's daily reminders"""
+        mode, window, receiver_email = self.preference(username)
+        reminders = sorted(
+            ({"time": _time(_minutes(n["time"])), "message": n["message"]} for n in notifications),
+            key=lambda n: n["time"]
+        )
+
+        plan = {}
+        for reminder in reminders:
+            if mode == DIGEST and plan:
+                first = max(plan)
+                if _minutes(reminder["time"]) - _minutes(first) < window:
+                    plan[first].append(reminder)
+                    continue
+            plan.setdefault(reminder["time"], []).append(reminder)
+
+        with self._lock:
+            self._plans[username] = (plan, receiver_email)
+        self.logger.info(f"Planned {len(reminders)} reminders for {username} in {len(plan)} emails ({mode})")
+
+    def due(self, time):
+        """Deliveries of all accounts due at an "HH:MM" time"""
+        with self._lock:
+            plans = list(self._plans.items())
+        return [
+            Delivery(username, time, plan[time], receiver_email)
+            for username, (plan, receiver_email) in plans if time in plan
+        ]
+
+    def planned(self, username):
+        """{"HH:MM": [reminders]} planned for an account"""
+        with self._lock:
+            plan, _ = self._plans.get(username, ({}, None))
+        return {time: list(reminders) for time, reminders in plan.items()}
@@ -0,0 +1,228 @@
+import json
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from fnmatch import fnmatchcase
+from pathlib import Path
+from .config import get_config_path
+
+_NOT_PROFILING = nullcontext()
+
+# Keeps the profiler's own allocations out of the memory summary
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, tracemalloc.__file__)
+]
+
+class SamplingProfiler:
+    """Sample the call stack of one thread at a fixed interval
+
+    Runs on a background thread reading sys._current_frames(), so the
+    profiled code itself is not instrumented.
+    """
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def top(self, limit):
+        """(own, cumulative) lists of (function, samples), most sampled first"""
+        own = Counter()
+        cumulative = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for function in set(stack):
+                cumulative[function] += count
+        return own.most_common(limit), cumulative.most_common(limit)
+
+class ProfilingService:
+    """Profile the next N executions of selected jobs and routes
+
+    Targets are names such as "job:sync", "task:health_monitor" or
+    "route:/get_health_data", armed by glob patterns. While nothing is
+    armed, profile() returns a shared no-op context after one dict check.
+    Each profiled execution writes a timestamped directory with a top-N
+    summary and the collapsed stacks. tracemalloc is process-wide, so only
+    one profile at a time measures memory, and overlapping ones are CPU
+    only.
+    """
+    def __init__(self):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.config_path = get_config_path()
+        self._lock = threading.Lock()
+        self._armed = {}
+        self._memory_busy = False
+        self._load_config()
+
+    def _load_config(self):
+        """Load profiling configuration, arming the configured targets"""
+        try:
+            with open(self.config_path, 'r') as f:
+                config = json.load(f)
+        except Exception:
+            config = {}
+
+        profiling_config = config.get("profiling", {})
+        self.directory = Path(profiling_config.get("directory", "data_export/profiles"))
+        self.interval = profiling_config.get("interval_ms", 5) / 1000
+        self.top_n = profiling_config.get("top", 25)
+        # Token required by the admin endpoint, the endpoint is disabled without it
+        self.admin_token = profiling_config.get("admin_token")
+        for pattern, count in profiling_config.get("targets", {}).items():
+            self.arm(pattern, count)
+
+    def arm(self, pattern, count=1):
+        """Profile the next `count` executions matching `pattern`, 0 disarms"""
+        with self._lock:
+            if count > 0:
+                self._armed[pattern] = count
+            else:
+                self._armed.pop(pattern, None)
+        self.logger.info(f"Profiling armed for {count} executions of {pattern}")
+
+    @property
+    def active(self):
+        """Whether anything is armed, cheap enough to check on every request"""
+        return bool(self._armed)
+
+    @property
+    def armed(self):
+        with self._lock:
+            return dict(self._armed)
+
+    def _take(self, target):
+        """Use up one armed execution for the target, False if none is armed"""
+        with self._lock:
+            for pattern, remaining in self._armed.items():
+                if fnmatchcase(target, pattern):
+                    if remaining > 1:
+                        self._armed[pattern] = remaining - 1
+                    else:
+                        del self._armed[pattern]
+                    return True
+        return False
+
+    def profile(self, target):
+        """Context manager profiling this execution of `target` if it is armed"""
+        if not self.active or not self._take(target):
+            return _NOT_PROFILING
+        return self._profiled(target)
+
+    @contextmanager
+    def _profiled(self, target):
+        with self._lock:
+            # Another profile's allocations and peak would be mixed into this one
+            memory = not self._memory_busy
+            self._memory_busy = self._memory_busy or memory
+        started_tracing = False
+        before = after = peak = None
+        if memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+        sampler = SamplingProfiler(threading.get_ident(), self.interval)
+        started_at = datetime.now()
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            wall = time.perf_counter() - start
+            if memory:
+                after = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+                if started_tracing:
+                    tracemalloc.stop()
+                with self._lock:
+                    self._memory_busy = False
+            try:
+                self._write(target, started_at, wall, sampler, before, after, peak)
+            except Exception as e:
+                self.logger.error(f"Failed to write profile of {target}: {str(e)}")
+
+    def _write(self, target, started_at, wall, sampler, before, after, peak):
+        slug = "".join(c if c.isalnum() else "_" for c in target).strip("_")
+        path = self.directory / f"{started_at.strftime('%Y%m%d-%H%M%S-%f')}_{slug}"
+        path.mkdir(parents=True, exist_ok=True)
+
+        own, cumulative = sampler.top(self.top_n)
+        total = max(1, sampler.samples)
+        lines = [
+            f"Profile of {target}",
+            f"Started {started_at.isoformat(timespec='seconds')}, wall time {wall * 1000:.1f} ms, "
+            f"{sampler.samples} samples every {self.interval * 1000:g} ms",
+            "",
+            "Top functions by own time",
+            "  samples     pct  function"
+        ]
+        lines += [f"  {count:7d}  {count * 100 / total:5.1f}%  {function}" for function, count in own]
+        lines += ["", "Top functions by cumulative time", "  samples     pct  function"]
+        lines += [f"  {count:7d}  {count * 100 / total:5.1f}%  {function}" for function, count in cumulative]
+        if after is None:
+            lines += ["", "Memory not profiled, another profile was tracing allocations"]
+        else:
+            lines += ["", f"Peak traced memory: {peak / 1024:.1f} KiB", "Top allocations during the execution",
+                      "  size KiB    count  location"]
+            after = after.filter_traces(_SNAPSHOT_FILTERS)
+            before = before.filter_traces(_SNAPSHOT_FILTERS)
+            for stat in after.compare_to(before, "lineno")[:self.top_n]:
+                frame = stat.traceback[0]
+                lines.append(f"  {stat.size_diff / 1024:8.1f} {stat.count_diff:8d}  {frame.filename}:{frame.lineno}")
+
+        (path / "summary.txt").write_text("\n".join(lines) + "\n", encoding="utf-8")
+        # Collapsed stacks, the input format of flame graph tools
+        (path / "stacks.txt").write_text(
+            "".join(f"{';'.join(stack)} {count}\n" for stack, count in sampler.stacks.most_common()),
+            encoding="utf-8"
+        )
+        self.logger.info(f"Wrote profile of {target} to {path}")
+
+    def artifacts(self, limit=20):
+        """Names of the most recent profile directories"""
+        if not self.directory.exists():
+            return []
+        return sorted((p.name for p in self.directory.iterdir() if p.is_dir()), reverse=True)[:limit]
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+def get_profiler():
+    """Get the process-wide ProfilingService"""
+    global _profiler
+    if _profiler is not None:
+        return _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = ProfilingService()
+        return _profiler
@@ -0,0 +1,95 @@
+import json
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+from .config import get_config_path
+
+# Requests per second and burst size for hosts without their own limit
+DEFAULT_RATE = 5.0
+DEFAULT_BURST = 10
+
+class TokenBucket:
+    """Thread-safe token bucket, a rate of 0 disables limiting"""
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Take a token, returns seconds to wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Tokens may go negative, queued callers then wait in arrival order
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self):
+        """Block until a token is available, returns the seconds waited"""
+        if not self.rate:
+            return 0.0
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def try_acquire(self):
+        """Take a token without waiting, returns 0 on success, else seconds until one is available"""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+class RateLimiter:
+    """Per-host token buckets shared by every upstream client in the process"""
+    def __init__(self, default=None, hosts=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        default = default or {}
+        self.default_rate = default.get("rate", DEFAULT_RATE)
+        self.default_burst = default.get("burst", DEFAULT_BURST)
+        self.hosts = hosts or {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, host):
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                limits = self.hosts.get(host, {})
+                bucket = TokenBucket(limits.get("rate", self.default_rate), limits.get("burst", self.default_burst))
+                self._buckets[host] = bucket
+            return bucket
+
+    def acquire(self, url):
+        """Wait for the rate budget of the host in `url`"""
+        host = urlparse(url).hostname or url
+        waited = self._bucket(host).acquire()
+        if waited > 0.5:
+            self.logger.debug(f"Waited {waited:.2f}s for rate budget of {host}")
+        return waited
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+def get_rate_limiter():
+    """Get the process-wide RateLimiter, configured by the "rate_limits" config section"""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            try:
+                with open(get_config_path(), 'r') as f:
+                    limits_config = json.load(f).get("rate_limits", {})
+            except Exception:
+                limits_config = {}
+            _rate_limiter = RateLimiter(limits_config.get("default"), limits_config.get("hosts"))
+        return _rate_limiter
@@ -0,0 +1,187 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+from .config import get_config_path
+
+# Environment variable that overrides the configured recording mode
+RECORDING_ENV_VAR = "HEALTH_MONITOR_RECORDING"
+
+MODES = ("off", "record", "replay")
+
+class RecordingService:
+    """Record raw upstream responses and replay them without network access
+
+    Response bodies are stored gzip-compressed under their SHA-256 digest, so
+    identical payloads are only stored once. An append-only index maps
+    (kind, key) to the digest of the most recent recording.
+
+    Replay only serves exact key matches unless `fallback` is enabled, in
+    which case a miss falls back to the latest recording of the same kind
+    and scope (e.g. the same account), never to another scope's data.
+    """
+    _lock = threading.Lock()
+
+    def __init__(self, mode=None, directory=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.config_path = get_config_path()
+        self._load_config()
+        if mode:
+            self.mode = mode
+        if directory:
+            self.directory = Path(directory)
+        if self.mode not in MODES:
+            raise ValueError(f"Unknown recording mode: {self.mode}")
+        self.index_path = self.directory / "index.jsonl"
+        self._index = None
+        self._latest = {}
+
+    def _load_config(self):
+        """Load recording configuration"""
+        try:
+            with open(self.config_path, 'r') as f:
+                config = json.load(f)
+        except Exception as e:
+            self.logger.debug(f"Recording configuration unavailable: {str(e)}")
+            config = {}
+
+        recording_config = config.get("recording", {})
+        self.mode = os.environ.get(RECORDING_ENV_VAR) or recording_config.get("mode", "off")
+        self.directory = Path(recording_config.get("directory", "data_export/recordings"))
+        self.fallback = recording_config.get("fallback", False)
+
+    @property
+    def recording(self):
+        return self.mode == "record"
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    def _object_path(self, digest):
+        return self.directory / "objects" / digest[:2] / f"{digest}.json.gz"
+
+    def _load_index(self):
+        """Load the index, later entries override earlier ones"""
+        if self._index is not None:
+            return self._index
+
+        index = {}
+        if self.index_path.exists():
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    index[(entry["kind"], entry["key"])] = entry
+                    self._latest[(entry["kind"], entry.get("scope"))] = entry
+        self._index = index
+        return index
+
+    def record(self, kind, key, body, scope=None):
+        """Store a raw response body, returns its digest"""
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()
+
+        try:
+            with self._lock:
+                path = self._object_path(digest)
+                if not path.exists():
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    tmp_path = path.with_suffix(".tmp")
+                    with gzip.open(tmp_path, 'wb') as f:
+                        f.write(body)
+                    tmp_path.replace(path)
+
+                self._add_entry(kind, key, digest, scope)
+
+            self.logger.info(f"Recorded {kind} response {digest[:12]} for {key}")
+            return digest
+
+        except Exception as e:
+            self.logger.error(f"Failed to record {kind} response: {str(e)}")
+            return None
+
+    def record_stream(self, kind, key, chunks, scope=None):
+        """Pass response body chunks through while recording them
+
+        The body is compressed to a temporary file as it streams by, so
+        recording never holds the whole response in memory. Nothing is
+        recorded if the consumer stops early.
+        """
+        hasher = hashlib.sha256()
+        tmp_path = self.directory / "objects" / f"stream-{uuid.uuid4().hex}.tmp"
+        try:
+            tmp_path.parent.mkdir(parents=True, exist_ok=True)
+            with gzip.open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    hasher.update(chunk)
+                    f.write(chunk)
+                    yield chunk
+
+            digest = hasher.hexdigest()
+            with self._lock:
+                path = self._object_path(digest)
+                if path.exists():
+                    tmp_path.unlink()
+                else:
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    tmp_path.replace(path)
+                self._add_entry(kind, key, digest, scope)
+            self.logger.info(f"Recorded {kind} response {digest[:12]} for {key}")
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+    def _add_entry(self, kind, key, digest, scope=None):
+        """Append an index entry, caller holds the lock"""
+        entry = {
+            "kind": kind,
+            "key": key,
+            "sha256": digest,
+            "recorded_at": datetime.now().isoformat(timespec="seconds")
+        }
+        if scope is not None:
+            entry["scope"] = scope
+        with open(self.index_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._load_index()[(kind, key)] = entry
+        self._latest[(kind, scope)] = entry
+
+    def _find_entry(self, kind, key, scope=None):
+        """Index entry for (kind, key), None on a miss unless fallback to the scope's latest is enabled"""
+        with self._lock:
+            index = self._load_index()
+            entry = index.get((kind, key))
+            if entry is None and self.fallback and scope is not None:
+                entry = self._latest.get((kind, scope))
+                if entry is not None:
+                    self.logger.info(f"No {kind} recording for {key}, using {entry['key']}")
+        return entry
+
+    def replay(self, kind, key, scope=None):
+        """Get a recorded response body, None if nothing was recorded for the key"""
+        f = self.open_replay(kind, key, scope)
+        if f is None:
+            return None
+        with f:
+            return f.read()
+
+    def open_replay(self, kind, key, scope=None):
+        """Open a recorded response body as a binary file, None if nothing was recorded"""
+        entry = self._find_entry(kind, key, scope)
+        if entry is None:
+            return None
+        return gzip.open(self._object_path(entry["sha256"]), 'rb')
+
+    @staticmethod
+    def make_key(*parts):
+        """Build a stable key from arbitrary JSON-serializable parts"""
+        payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
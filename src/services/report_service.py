@@ -0,0 +1,205 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+from .health_store import get_health_store
+
+ACTIVITY_MODES = {
+    1: "Walking",
+    3: "Fast Walking",
+    4: "Running",
+    5: "Cycling"
+}
+
+META_COLUMNS = ["user_id", "date", "data_type", "source", "device_id", "uuid", "summary"]
+
+# Rendered reports kept in memory, keyed by (user_id, start, end)
+CACHE_SIZE = 32
+
+# Rendered reports kept on disk per user, the least recently written are deleted
+FILES_PER_USER = 8
+
+def get_mode_description(mode):
+    """Get activity mode description"""
+    return ACTIVITY_MODES.get(mode, f"Unknown mode({mode})")
+
+class ReportService:
+    """Render detailed text reports on demand from the local store
+
+    Reports are cached by store data version, both in memory and on disk,
+    so unchanged data is never rendered twice.
+    """
+    _cache = OrderedDict()
+    _cache_lock = threading.Lock()
+
+    def __init__(self, store=None, report_dir="data_export"):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.store = store or get_health_store()
+        self.report_dir = Path(report_dir)
+
+    def resolve_user(self, username=None):
+        """Pick the user a report is for: the given account, else the single stored user"""
+        if username:
+            user_id = self.store.user_for_account(username)
+            if user_id:
+                return user_id
+        users = self.store.users()
+        return users[0] if len(users) == 1 else None
+
+    def default_range(self, user_id, days=3):
+        """The `days` days ending at the user's latest stored date"""
+        end_date = self.store.latest_date(user_id)
+        if not end_date:
+            return None, None
+        start_date = (datetime.strptime(end_date, "%Y-%m-%d") - timedelta(days=days)).strftime("%Y-%m-%d")
+        return start_date, end_date
+
+    def get_report(self, user_id, start_date=None, end_date=None):
+        """Get (report text, download filename), rendering only if the data changed"""
+        if not start_date or not end_date:
+            start_date, end_date = self.default_range(user_id)
+            if not start_date:
+                return None, None
+
+        key = (user_id, start_date, end_date)
+        version = self.store.data_version(user_id)
+        filename = f"api_response_{start_date.replace('-', '')}_{end_date.replace('-', '')}.txt"
+
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached and cached[0] == version:
+                self._cache.move_to_end(key)
+                return cached[1], filename
+
+        path = self._report_path(key, version)
+        if path.exists():
+            text = path.read_text(encoding='utf-8')
+        else:
+            text = self.render(user_id, start_date, end_date)
+            if text is None:
+                return None, None
+            self._write_report(key, path, text)
+
+        with self._cache_lock:
+            self._cache[key] = (version, text)
+            self._cache.move_to_end(key)
+            while len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return text, filename
+
+    def _report_path(self, key, version):
+        user_id, start_date, end_date = key
+        return self.report_dir / "reports" / f"report_{user_id}_{start_date}_{end_date}_v{version}.txt"
+
+    def _write_report(self, key, path, text):
+        """Write the report in a single write, replacing older versions and pruning the user's oldest reports"""
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            user_id, start_date, end_date = key
+            for old_file in path.parent.glob(f"report_{user_id}_{start_date}_{end_date}_v*.txt"):
+                old_file.unlink()
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            self.logger.info(f"Detailed health data report saved to: {path}")
+
+            # The default range moves every day, so old ranges are never asked for again
+            reports = sorted(
+                path.parent.glob(f"report_{user_id}_????-??-??_????-??-??_v*.txt"),
+                key=lambda p: p.stat().st_mtime, reverse=True
+            )
+            for old_file in reports[FILES_PER_USER:]:
+                old_file.unlink(missing_ok=True)
+        except Exception as e:
+            self.logger.error(f"Failed to save report: {str(e)}")
+
+    def render(self, user_id, start_date, end_date):
+        """Render the detailed report for a user and date range"""
+        rows = list(self.store.iter_days([user_id], start_date, end_date, META_COLUMNS))
+        if not rows:
+            return None
+
+        parts = [
+            "=== Zepp Health Data ===\n",
+            f"Statistics Period: {start_date} to {end_date}\n",
+            f"Store Version: {self.store.data_version(user_id)}\n\n"
+        ]
+
+        for uid, date, data_type, source, device_id, uuid, summary in rows:
+            parts.append(f"Date: {date}\n")
+            parts.append("-" * 50 + "\n")
+            parts.append(f"User ID: {uid}\n")
+            parts.append(f"Data Type: {data_type}\n")
+            parts.append(f"Data Source: {source}\n")
+            parts.append(f"Device ID: {device_id}\n")
+            parts.append(f"UUID: {uuid}\n\n")
+
+            try:
+                self._render_summary(parts, json.loads(summary))
+            except Exception as e:
+                parts.append(f"Data parsing error: {str(e)}\n\n")
+
+        return "".join(parts)
+
+    def _render_summary(self, parts, summary_json):
+        parts.append("Data Version: v" + str(summary_json.get('v', 'Unknown')) + "\n\n")
+
+        # Sleep data details
+        if "slp" in summary_json:
+            slp = summary_json["slp"]
+            parts.append(
+                "Sleep Data Details:\n"
+                f"  Start Timestamp: {slp.get('st')}\n"
+                f"  End Timestamp: {slp.get('ed')}\n"
+                f"  Deep Sleep Duration: {slp.get('dp')} minutes\n"
+                f"  Light Sleep Duration: {slp.get('lt')} minutes\n"
+                f"  Wake Count: {slp.get('wk')} times\n"
+                f"  User Set Start Time: {slp.get('usrSt')} minutes\n"
+                f"  User Set End Time: {slp.get('usrEd')} minutes\n"
+                f"  Wake Duration: {slp.get('wc')} minutes\n"
+                f"  Sleep State: {slp.get('is')}\n"
+                f"  Sleep Score: {slp.get('lb')}\n"
+                f"  Sleep Goal: {slp.get('to')} minutes\n"
+                f"  Sleep Deviation: {slp.get('dt')} minutes\n"
+                f"  Resting Heart Rate: {slp.get('rhr')} bpm\n"
+                f"  Sleep Score: {slp.get('ss')}\n\n"
+            )
+
+        # Step data details
+        if "stp" in summary_json:
+            stp = summary_json["stp"]
+            parts.append(
+                "Step Data Details:\n"
+                f"  Total Steps: {stp.get('ttl', 0):,} steps\n"
+                f"  Total Distance: {stp.get('dis', 0):,} meters\n"
+                f"  Calories Burned: {stp.get('cal', 0):,} kcal\n"
+                f"  Walking Duration: {stp.get('wk', 0)} minutes\n"
+                f"  Running Count: {stp.get('rn', 0)} times\n"
+                f"  Running Distance: {stp.get('runDist', 0):,} meters\n"
+                f"  Running Calories: {stp.get('runCal', 0):,} kcal\n\n"
+            )
+
+            # Activity stage details
+            if "stage" in stp:
+                parts.append("Activity Stage Details:\n")
+                for i, stage in enumerate(stp["stage"], 1):
+                    parts.append(
+                        f"  Stage {i}:\n"
+                        f"    Start Time: {stage.get('start')} minutes\n"
+                        f"    End Time: {stage.get('stop')} minutes\n"
+                        f"    Activity Mode: {get_mode_description(stage.get('mode'))}\n"
+                        f"    Distance: {stage.get('dis', 0):,} meters\n"
+                        f"    Calories: {stage.get('cal', 0)} kcal\n"
+                        f"    Steps: {stage.get('step', 0):,} steps\n\n"
+                    )
+
+        # Other data
+        parts.append(
+            "Other Data:\n"
+            f"  Step Goal: {summary_json.get('goal', 0):,} steps\n"
+            f"  Timezone: {summary_json.get('tz')} seconds\n"
+            f"  Data Length: {summary_json.get('byteLength')} bytes\n"
+            f"  Sync Timestamp: {summary_json.get('sync')} ({datetime.fromtimestamp(summary_json.get('sync', 0)/1000).strftime('%Y-%m-%d %H:%M:%S')})\n"
+        )
+        parts.append("\n" + "=" * 50 + "\n\n")
@@ -2,9 +2,9 @@ from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 import logging
 from datetime import datetime
-from pathlib import Path
 from .email_service import EmailService
-import json
+from .advice_archive import get_advice_archive
+from .health_store import get_health_store, format_rollups, trend_start
 
 class SchedulerService:
     def __init__(self, task_function):
@@ -70,20 +70,14 @@ class SchedulerService:
         """Send daily summary"""
         try:
             # Read the latest advice data
-            data_dir = Path("data_export/advice")
-            if not data_dir.exists():
+            record = get_advice_archive().latest_record()
+            if not record:
                 return
                 
-            files = list(data_dir.glob("health_advice_*.json"))
-            if not files:
-                return
-                
-            latest_file = max(files, key=lambda x: x.stat().st_mtime)
-            
-            with open(latest_file, 'r', encoding='utf-8') as f:
-                advice_data = json.load(f)
-                
-            self.email_service.send_daily_summary(advice_data)
+            trends = format_rollups(
+                get_health_store().rollups(record["user_id"], "week", start=trend_start(90))
+            )
+            self.email_service.send_daily_summary(record["advice"], trends)
             
         except Exception as e:
             self.logger.error(f"Failed to send daily summary: {str(e)}")
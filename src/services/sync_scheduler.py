@@ -0,0 +1,169 @@
+import heapq
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from .config import get_config_path
+from .health_store import get_health_store
+
+class SyncScheduler:
+    """Sync accounts in priority order within the nightly sync window
+
+    Accounts whose newest stored data is oldest go first, weighted up by
+    recent activity. Accounts fetched within `min_interval_hours` are
+    skipped. First attempts are spread evenly over the rest of the window,
+    so the nth account in the queue does not start before its own target
+    time, and the per-host rate limits pace the calls within each sync. A
+    failed account is retried after the others, and whatever is left when
+    the window closes waits for the next night, where it is the stalest
+    and goes first.
+    """
+    def __init__(self):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.config_path = get_config_path()
+        self._load_config()
+        self.store = get_health_store()
+
+    def _load_config(self):
+        """Load sync configuration"""
+        try:
+            with open(self.config_path, 'r') as f:
+                config = json.load(f)
+        except Exception:
+            config = {}
+
+        sync_config = config.get("sync", {})
+        self.window_start = sync_config.get("window_start", "03:00")
+        self.window_end = sync_config.get("window_end", "05:00")
+        self.max_concurrency = sync_config.get("max_concurrency", 2)
+        self.min_interval_hours = sync_config.get("min_interval_hours", 6)
+        # How much recent activity raises priority, 0 orders by staleness only
+        self.activity_weight = sync_config.get("activity_weight", 1.0)
+        # Extra attempts for an account whose sync failed
+        self.retries = sync_config.get("retries", 1)
+        # Spread first attempts over the window instead of starting them all when it opens
+        self.spread = sync_config.get("spread", True)
+        self.step_goal = config.get("health", {}).get("step_goal", 8000)
+
+    @property
+    def start_time(self):
+        """(hour, minute) the nightly window opens"""
+        hour, minute = self.window_start.split(":")
+        return int(hour), int(minute)
+
+    def current_slot(self, now=None):
+        """Date of the most recent window opening"""
+        now = now or datetime.now()
+        hour, minute = self.start_time
+        if (now.hour, now.minute) < (hour, minute):
+            now -= timedelta(days=1)
+        return now.strftime("%Y-%m-%d")
+
+    def _deadline(self, now):
+        """End of the window `now` falls in, None outside the window"""
+        opened = datetime.strptime(f"{self.current_slot(now)} {self.window_start}", "%Y-%m-%d %H:%M")
+        closes = datetime.strptime(f"{opened:%Y-%m-%d} {self.window_end}", "%Y-%m-%d %H:%M")
+        if closes <= opened:
+            closes += timedelta(days=1)
+        return closes if now < closes else None
+
+    def priority(self, username):
+        """Staleness in hours of the account's newest data, weighted by recent activity"""
+        user_id = self.store.user_for_account(username)
+        last_sync = self.store.last_device_sync(user_id) if user_id else None
+        if last_sync is None:
+            # Never synced, nothing is staler
+            return float("inf")
+
+        staleness = max(0.0, time.time() - last_sync) / 3600
+        start = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d")
+        activity = min(3.0, self.store.average_steps(user_id, start) / max(1, self.step_goal))
+        return staleness * (1 + self.activity_weight * activity)
+
+    def build_queue(self, accounts, force=False):
+        """Heap of (-priority, position, account), skipping recently fetched accounts"""
+        queue = []
+        skipped = 0
+        for position, account in enumerate(accounts):
+            username = account.get("username")
+            state = self.store.sync_state(username)
+            if not force and state and time.time() - state["last_fetch"] < self.min_interval_hours * 3600:
+                skipped += 1
+                continue
+            queue.append((-self.priority(username), position, account))
+        heapq.heapify(queue)
+        return queue, skipped
+
+    def run(self, accounts, task, claim=None, force=False, job=None):
+        """Run `task(account)` for the accounts in priority order
+
+        `claim(account)` is asked right before an account's first attempt
+        and returning False skips it, e.g. when another process already ran
+        it. Forced runs and runs outside the window start every account
+        right away. Returns counts of synced, skipped, deferred, retried and
+        failed accounts.
+        """
+        queue, skipped = self.build_queue(accounts, force)
+        total = len(queue)
+        opened = datetime.now()
+        deadline = None if force else self._deadline(opened)
+        # Target start of the nth first attempt is `opened + n * spacing`
+        spacing = (deadline - opened) / total if deadline and self.spread and total else timedelta(0)
+        counts = {"synced": 0, "skipped": skipped, "deferred": 0, "retried": 0, "failed": 0}
+        attempts = {}
+        started = [0]
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                with lock:
+                    if not queue:
+                        return
+                    _, position, account = heapq.heappop(queue)
+                    if deadline and datetime.now() >= deadline:
+                        counts["deferred"] += 1
+                        continue
+                    first_attempt = position not in attempts
+                    attempts[position] = attempts.get(position, 0) + 1
+                    not_before = opened + spacing * started[0] if first_attempt else None
+                    if first_attempt:
+                        started[0] += 1
+                if not_before:
+                    wait = (not_before - datetime.now()).total_seconds()
+                    if wait > 0:
+                        time.sleep(wait)
+                if first_attempt and claim and not claim(account):
+                    with lock:
+                        counts["skipped"] += 1
+                    continue
+                try:
+                    task(account)
+                    outcome = "synced"
+                except Exception as e:
+                    self.logger.error(f"Sync of {account.get('username')} failed: {str(e)}")
+                    outcome = "failed"
+                with lock:
+                    if outcome == "failed" and attempts[position] <= self.retries:
+                        # Retried after every account not yet attempted
+                        heapq.heappush(queue, (float("inf"), position, account))
+                        outcome = "retried"
+                    counts[outcome] += 1
+                    done = total - len(queue)
+                if job:
+                    job.update(round(done * 100 / total), f"Synced {done} of {total} accounts")
+
+        workers = [
+            threading.Thread(target=worker, name=f"sync-{i}", daemon=True)
+            for i in range(max(1, min(self.max_concurrency, total)))
+        ]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.logger.info(
+            f"Sync finished: {counts['synced']} synced, {counts['skipped']} skipped, "
+            f"{counts['deferred']} deferred, {counts['retried']} retried, {counts['failed']} failed"
+        )
+        return counts
@@ -1,8 +1,6 @@
 import logging
 from services.email_service import EmailService
-from pathlib import Path
-import json
-from datetime import datetime
+from services.advice_archive import get_advice_archive
 
 def setup_logging():
     logging.basicConfig(
@@ -17,18 +15,7 @@ def setup_logging():
 def get_latest_advice():
     """Get the latest health advice"""
     try:
-        data_dir = Path("data_export/advice")
-        if not data_dir.exists():
-            return None
-            
-        files = list(data_dir.glob("health_advice_*.json"))
-        if not files:
-            return None
-            
-        latest_file = max(files, key=lambda x: x.stat().st_mtime)
-        
-        with open(latest_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return get_advice_archive().latest()
     except Exception as e:
         logging.error(f"Failed to read health advice: {str(e)}")
         return None
@@ -1,11 +1,88 @@
-from flask import Flask, render_template, jsonify, request, send_from_directory, redirect
+from flask import Flask, render_template, jsonify, request, send_from_directory, send_file, redirect, Response, g
 import json
+import base64
+import hmac
 from pathlib import Path
 import logging
-from services.mi_fit_service import MiFitService
 import os
+import tempfile
+import threading
+from functools import wraps
 from flask_cors import CORS
-from services.health_advisor_service import HealthAdvisorService
+from services.config import get_config_path
+from services.export_service import ExportService
+from services.report_service import ReportService
+from services.advice_archive import get_advice_archive
+from services.job_service import get_job_service
+from services.health_store import get_health_store, DAY_METRICS, trend_start
+from services.activity_index import get_activity_index, activity_summary, recent_range
+from services.profiling_service import get_profiler
+from services.admission import get_admission_controller, Rejected
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _configured_username():
+    """Get the account username from config, None if unavailable"""
+    try:
+        with open(get_config_path(), 'r') as f:
+            return json.load(f).get("username")
+    except Exception:
+        return None
+
+_config_write_lock = threading.Lock()
+
+def _update_config(changes):
+    """Set top-level config keys, keeping every other section
+
+    The file is rewritten through a temporary file and an atomic rename, so
+    readers never see a partial config. A config that exists but does not
+    parse is left untouched.
+    """
+    config_path = Path(get_config_path())
+    with _config_write_lock:
+        try:
+            with open(config_path, 'r') as f:
+                config = json.load(f)
+        except FileNotFoundError:
+            config = {}
+        config.update(changes)
+        
+        config_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=config_path.parent, prefix=".config-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(config, f, indent=2)
+            os.replace(tmp_path, config_path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+# Pre-serialized probe responses
+_HEALTHZ_BODY = b'{"status":"ok"}'
+_READY_BODY = b'{"status":"ready"}'
+_NOT_READY_BODY = b'{"status":"not ready"}'
+
+# Page size limits for the query API
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def _json_response(payload, status=200):
+    """Serialize compact JSON, using orjson when it is installed"""
+    if orjson is not None:
+        body = orjson.dumps(payload)
+    else:
+        body = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode('utf-8')
+    return Response(body, status=status, mimetype="application/json")
+
+def _encode_cursor(row):
+    return base64.urlsafe_b64encode(json.dumps([row[0], row[1]]).encode('utf-8')).decode('ascii')
+
+def _decode_cursor(cursor):
+    user_id, date = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    return str(user_id), str(date)
 
 def create_app():
     """Create Flask application"""
@@ -23,10 +100,93 @@ def create_app():
             ]
         )
 
+    profiler = get_profiler()
+
+    @app.before_request
+    def start_profiling():
+        # Only the armed check runs while profiling is off
+        if profiler.active and request.url_rule is not None:
+            profile = profiler.profile(f"route:{request.url_rule.rule}")
+            profile.__enter__()
+            g.profile = profile
+
+    @app.teardown_request
+    def stop_profiling(exc):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profile.__exit__(None, None, None)
+
+    admission = get_admission_controller()
+
+    def client_id():
+        if admission.client_header:
+            forwarded = request.headers.get(admission.client_header)
+            if forwarded:
+                return forwarded.split(',')[0].strip()
+        return request.remote_addr or "unknown"
+
+    def cached_response(payload, age, cache_status):
+        response = jsonify(payload)
+        response.headers['X-Cache'] = cache_status
+        response.headers['Age'] = str(int(age))
+        return response
+
+    def admitted(view):
+        """Run a view that triggers upstream work under admission control
+
+        The view returns the JSON payload. Fresh cached payloads are served
+        without being admitted, and a stale one is served instead of
+        rejecting a request.
+        """
+        @wraps(view)
+        def wrapper():
+            key = (request.path, _configured_username())
+            cached = admission.cached(key, admission.cache_seconds)
+            if cached:
+                return cached_response(*cached, 'HIT')
+            try:
+                with admission.admit(client_id()):
+                    # A request queued ahead of this one may have refreshed it
+                    cached = admission.cached(key, admission.cache_seconds)
+                    if cached:
+                        return cached_response(*cached, 'HIT')
+                    payload = view()
+            except Rejected as e:
+                stale = admission.cached(key, admission.stale_seconds)
+                if stale:
+                    return cached_response(*stale, 'STALE')
+                response = _json_response({"success": False, "message": str(e)}, 429)
+                response.headers['Retry-After'] = str(e.retry_after)
+                return response
+            except Exception as e:
+                return jsonify({"success": False, "message": str(e)})
+            admission.store(key, payload)
+            return jsonify(payload)
+        return wrapper
+
+    @app.route('/healthz')
+    def healthz():
+        # Liveness probe, never touches config, storage or templates
+        return _HEALTHZ_BODY, 200, {"Content-Type": "application/json"}
+
+    @app.route('/readyz')
+    def readyz():
+        # Ready once the config is readable and the store opens, the store is only opened once
+        try:
+            with open(get_config_path(), 'r') as f:
+                json.load(f)
+            if not app.config.get('STORE_READY'):
+                get_health_store()
+                app.config['STORE_READY'] = True
+        except Exception as e:
+            app.logger.warning(f"Not ready: {str(e)}")
+            return _NOT_READY_BODY, 503, {"Content-Type": "application/json"}
+        return _READY_BODY, 200, {"Content-Type": "application/json"}
+
     @app.route('/')
     def index():
         try:
-            config_path = Path(__file__).parent.parent / "data" / "config.json"
+            config_path = get_config_path()
             with open(config_path, 'r') as f:
                 config = json.load(f)
                 username = config.get("username", "")
@@ -49,51 +209,209 @@ def create_app():
             if not username or not password:
                 return jsonify({"success": False, "message": "Username and password cannot be empty"})
             
-            config_path = Path(__file__).parent.parent / "data" / "config.json"
-            with open(config_path, 'w') as f:
-                json.dump({"username": username, "password": password}, f, indent=2)
+            _update_config({"username": username, "password": password})
                 
             return jsonify({"success": True, "message": "Credentials updated successfully"})
         except Exception as e:
             return jsonify({"success": False, "message": str(e)})
 
     @app.route('/get_health_data')
+    @admitted
     def get_health_data():
+        from services.mi_fit_service import MiFitService
+        service = MiFitService()
+        return service.get_health_data()
+
+    @app.route('/api/health_data')
+    def query_health_data():
+        try:
+            fields = [f for f in request.args.get('fields', '').split(',') if f] or list(DAY_METRICS)
+            users = [u for u in request.args.get('users', '').split(',') if u] or None
+            limit = min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+            cursor = request.args.get('cursor')
+            after = _decode_cursor(cursor) if cursor else None
+        except Exception as e:
+            return _json_response({"success": False, "message": f"Invalid query: {str(e)}"}, 400)
+            
+        try:
+            # One extra row tells whether another page follows
+            rows = get_health_store().query_days(
+                fields, users, request.args.get('start'), request.args.get('end'), after, limit + 1
+            )
+        except ValueError as e:
+            return _json_response({"success": False, "message": str(e)}, 400)
+        except Exception as e:
+            return _json_response({"success": False, "message": str(e)}, 500)
+            
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        columns = rows[0].keys() if rows else []
+        return _json_response({
+            "success": True,
+            "records": [dict(zip(columns, row)) for row in rows],
+            "next_cursor": _encode_cursor(rows[-1]) if has_more else None
+        })
+
+    @app.route('/api/rollups')
+    def query_rollups():
+        try:
+            user_id = request.args.get('user') or ReportService().resolve_user(_configured_username())
+            if not user_id:
+                return _json_response({"success": False, "message": "No health data available"}, 404)
+            metrics = [m for m in request.args.get('metrics', '').split(',') if m] or None
+            periods = get_health_store().rollups(
+                user_id,
+                request.args.get('period', 'week'),
+                request.args.get('start') or trend_start(request.args.get('days', 90, type=int)),
+                request.args.get('end'),
+                metrics
+            )
+            return _json_response({"success": True, "user_id": user_id, "periods": periods})
+        except ValueError as e:
+            return _json_response({"success": False, "message": str(e)}, 400)
+        except Exception as e:
+            return _json_response({"success": False, "message": str(e)}, 500)
+
+    @app.route('/api/chart')
+    def query_chart():
         try:
-            service = MiFitService()
-            data = service.get_health_data()
-            return jsonify(data)
+            from services.chart_service import ChartService
+            user_id = request.args.get('user') or ReportService().resolve_user(_configured_username())
+            if not user_id:
+                return _json_response({"success": False, "message": "No health data available"}, 404)
+            service = ChartService()
+            start_date, end_date = service.default_range(user_id, request.args.get('days', 365, type=int))
+            start_date = request.args.get('start') or start_date
+            end_date = request.args.get('end') or end_date
+            if not start_date or not end_date:
+                return _json_response({"success": False, "message": "No health data available"}, 404)
+            start_date, end_date = service.clamp_range(user_id, start_date, end_date)
+            series = [s for s in request.args.get('series', 'steps,sleep,resting_hr').split(',') if s]
+            chart = service.get_chart(
+                user_id, series, start_date, end_date,
+                request.args.get('points', 300, type=int),
+                request.args.get('method', 'lttb')
+            )
+            return _json_response({
+                "success": True, "user_id": user_id, "start": start_date, "end": end_date, "series": chart
+            })
+        except ValueError as e:
+            return _json_response({"success": False, "message": str(e)}, 400)
+        except Exception as e:
+            return _json_response({"success": False, "message": str(e)}, 500)
+
+    @app.route('/api/activity')
+    def query_activity():
+        try:
+            user_id = request.args.get('user') or ReportService().resolve_user(_configured_username())
+            if not user_id:
+                return _json_response({"success": False, "message": "No health data available"}, 404)
+            start_date, end_date = recent_range(request.args.get('days', 30, type=int))
+            index = get_activity_index(get_health_store(), user_id)
+            summary = activity_summary(
+                index, request.args.get('start') or start_date, request.args.get('end') or end_date
+            )
+            return _json_response({"success": True, "user_id": user_id, "data": summary})
+        except ValueError as e:
+            return _json_response({"success": False, "message": str(e)}, 400)
+        except Exception as e:
+            return _json_response({"success": False, "message": str(e)}, 500)
+
+    @app.route('/jobs/refresh', methods=['POST'])
+    def start_refresh_job():
+        try:
+            username = _configured_username()
+            key = f"refresh:{username}"
+            jobs = get_job_service()
+            
+            # Joining a running refresh starts no upstream work, a new one is admitted
+            # here and holds its turn until the job finishes
+            job = jobs.active(key)
+            if job is None:
+                turn = admission.admit(client_id())
+                try:
+                    turn.__enter__()
+                except Rejected as e:
+                    response = _json_response({"success": False, "message": str(e)}, 429)
+                    response.headers['Retry-After'] = str(e.retry_after)
+                    return response
+                    
+                def release():
+                    turn.__exit__(None, None, None)
+                    
+                def refresh(job):
+                    from services.mi_fit_service import MiFitService
+                    try:
+                        job.update(10, "Fetching health data")
+                        service = MiFitService()
+                        data = service.get_health_data()
+                        return {
+                            "user_id": service.store.user_for_account(service.username),
+                            "days": len(data.get("data") or [])
+                        }
+                    finally:
+                        release()
+                        
+                try:
+                    job = jobs.submit("refresh", refresh, key=key, on_join=release)
+                except Exception:
+                    release()
+                    raise
+            return jsonify({"success": True, "job_id": job.id, "status": job.status}), 202
         except Exception as e:
             return jsonify({"success": False, "message": str(e)})
 
+    @app.route('/jobs/<job_id>')
+    def get_job(job_id):
+        job = get_job_service().get(job_id)
+        if not job:
+            return jsonify({"success": False, "message": "Job not found"}), 404
+        return jsonify({"success": True, "data": job.to_dict()})
+
+    @app.route('/jobs/<job_id>/events')
+    def job_events(job_id):
+        jobs = get_job_service()
+        job = jobs.get(job_id)
+        if not job:
+            return jsonify({"success": False, "message": "Job not found"}), 404
+            
+        def stream():
+            # Server-sent events, one message per job update until it finishes
+            revision = None
+            while True:
+                state, revision = jobs.wait(job, revision)
+                yield f"data: {json.dumps(state)}\n\n"
+                if job.done:
+                    break
+                    
+        return Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
     @app.route('/download_report')
     def download_report():
         try:
-            data_dir = Path("data_export")
-            app.logger.debug(f"Checking directory: {data_dir.absolute()}")
+            reports = ReportService()
+            username = request.args.get('username') or _configured_username()
+            user_id = reports.resolve_user(username)
             
-            if not data_dir.exists():
-                app.logger.error("Directory does not exist")
+            if not user_id:
+                app.logger.error("No stored health data")
                 return jsonify({"success": False, "message": "No reports available for download"})
                 
-            files = list(data_dir.glob("api_response_*.txt"))
-            app.logger.debug(f"Found files: {[f.name for f in files]}")
+            file_content, filename = reports.get_report(
+                user_id, request.args.get('start'), request.args.get('end')
+            )
             
-            if not files:
-                app.logger.error("Directory is empty")
+            if not file_content:
+                app.logger.error("No data in report range")
                 return jsonify({"success": False, "message": "No reports available for download"})
                 
-            latest_file = max(files, key=lambda x: x.stat().st_mtime)
-            app.logger.debug(f"Preparing to download file: {latest_file.name}")
-            
-            # Read file content
-            with open(latest_file, 'rb') as f:
-                file_content = f.read()
+            app.logger.debug(f"Preparing to download report: {filename}")
+            file_content = file_content.encode('utf-8')
                 
             # Create response
             response = app.make_response(file_content)
             response.headers["Content-Type"] = "text/plain; charset=utf-8"
-            response.headers["Content-Disposition"] = f"attachment; filename={latest_file.name}"
+            response.headers["Content-Disposition"] = f"attachment; filename={filename}"
             response.headers["Content-Length"] = len(file_content)
             response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
             response.headers["Pragma"] = "no-cache"
@@ -106,21 +424,77 @@ def create_app():
             app.logger.error(f"Download failed: {str(e)}")
             return jsonify({"success": False, "message": str(e)})
 
+    @app.route('/export_history')
+    def export_history():
+        try:
+            users = request.args.getlist('user') or None
+            start = request.args.get('start')
+            end = request.args.get('end')
+            
+            # Streamed from an anonymous temporary file, removed when the server closes it
+            archive = ExportService().export_temp_file(users, start, end)
+            response = send_file(archive, mimetype="application/octet-stream",
+                                 as_attachment=True, download_name="health_history.npz")
+            response.content_length = os.fstat(archive.fileno()).st_size
+            return response
+        except Exception as e:
+            app.logger.error(f"Export failed: {str(e)}")
+            return jsonify({"success": False, "message": str(e)})
+
     @app.route('/get_health_advice')
+    @admitted
     def get_health_advice():
+        # Heavy clients are imported on first use to keep startup fast
+        from services.mi_fit_service import MiFitService
+        from services.health_advisor_service import HealthAdvisorService
+        
+        # Get health data
+        service = MiFitService()
+        health_data = service.get_health_data()
+        
+        # Get health advice
+        advisor = HealthAdvisorService()
+        advice = advisor.get_health_advice(health_data)
+        
+        return {"success": True, "data": advice}
+
+    @app.route('/latest_advice')
+    def latest_advice():
         try:
-            # Get health data
-            service = MiFitService()
-            health_data = service.get_health_data()
-            
-            # Get health advice
-            advisor = HealthAdvisorService()
-            advice = advisor.get_health_advice(health_data)
-            
-            return jsonify({"success": True, "data": advice})
+            user_id = request.args.get('user')
+            if not user_id:
+                user_id = ReportService().resolve_user(_configured_username())
+            record = get_advice_archive().latest_record(user_id)
+            if not record:
+                return jsonify({"success": False, "message": "No health advice available"})
+            return jsonify({"success": True, "data": record})
         except Exception as e:
             return jsonify({"success": False, "message": str(e)})
 
+    @app.route('/admin/profile', methods=['GET', 'POST'])
+    def admin_profile():
+        """Arm profiling of the next executions of a job or route, and list recent profiles"""
+        token = request.headers.get('X-Admin-Token', '')
+        if not profiler.admin_token or not hmac.compare_digest(token, profiler.admin_token):
+            return _json_response({"success": False, "message": "Forbidden"}, 403)
+            
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            target = data.get('target')
+            try:
+                count = int(data.get('count', 1))
+            except (TypeError, ValueError):
+                count = None
+            if not target or count is None:
+                return _json_response({"success": False, "message": "target and a numeric count are required"}, 400)
+            profiler.arm(target, count)
+            
+        return _json_response({
+            "success": True,
+            "armed": profiler.armed,
+            "profiles": profiler.artifacts()
+        })
+
     @app.route('/update_email', methods=['POST'])
     def update_email():
         try:
@@ -130,14 +504,7 @@ def create_app():
             if not email:
                 return jsonify({"success": False, "message": "Email cannot be empty"})
                 
-            config_path = Path(__file__).parent.parent / "data" / "config.json"
-            with open(config_path, 'r') as f:
-                config = json.load(f)
-                
-            config['receiver_email'] = email
-            
-            with open(config_path, 'w') as f:
-                json.dump(config, f, indent=2)
+            _update_config({"receiver_email": email})
                 
             return jsonify({"success": True, "message": "Email updated successfully"})
         except Exception as e: